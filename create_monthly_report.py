@@ -17,17 +17,15 @@ from pathlib import Path
 _HERE = Path(__file__).parent
 sys.path.insert(0, str(_HERE))
 
-from report_sync import create_next_month_report, list_reports
-
 
 def main():
     args = sys.argv[1:]
-    today = date.today()
 
     if len(args) == 0:
         # 今月の翌月を生成
-        year  = today.strftime('%Y')
-        month = today.strftime('%m')
+        today = date.today()
+        year  = f'{today.year:04d}'
+        month = f'{today.month:02d}'
     elif len(args) == 1:
         try:
             year, month = args[0].split('-')
@@ -39,6 +37,9 @@ def main():
         print('使い方: python3 create_monthly_report.py [YYYY-MM]')
         sys.exit(1)
 
+    # openpyxl の読み込みが重いため、引数チェックを通過してから import する
+    from report_sync import create_next_month_report, list_reports
+
     print(f'=== 翌月作業報告書自動生成 (基準月: {year}-{month}) ===')
 
     # 現在のファイル一覧を表示
@@ -4,12 +4,17 @@ STRUCTURE.md 自動生成スクリプト
 attendance-pwa ディレクトリの構成図を常に最新の状態で STRUCTURE.md に出力する。
 
 使い方:
-  python3 generate_structure.py
+  python3 generate_structure.py            # 前回から変化がなければ書き込まずに終了
+  python3 generate_structure.py --force    # 常に再生成
 
 launchd により毎朝 07:30 に自動実行される。
 """
+import functools
+import hashlib
 import os
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
 
@@ -41,45 +46,84 @@ FILE_DESCRIPTIONS = {
 }
 
 
-def human_size(path: Path) -> str:
-    try:
-        s = path.stat().st_size
-        if s < 1024:
-            return f'{s} B'
-        elif s < 1024 * 1024:
-            return f'{s / 1024:.1f} KB'
-        else:
-            return f'{s / 1024 / 1024:.1f} MB'
-    except Exception:
+@dataclass(slots=True)
+class FileRow:
+    """ファイル一覧の 1 行分。stat は走査時に 1 回だけ取る（取得失敗時は size / mtime が None）"""
+    name: str
+    rel: str
+    size: int | None
+    mtime: float | None
+    desc: str
+
+
+def human_size(s: int | None) -> str:
+    if s is None:
         return '?'
+    if s < 1024:
+        return f'{s} B'
+    elif s < 1024 * 1024:
+        return f'{s / 1024:.1f} KB'
+    else:
+        return f'{s / 1024 / 1024:.1f} MB'
 
 
-def mod_time(path: Path) -> str:
-    try:
-        ts = path.stat().st_mtime
-        return datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M')
-    except Exception:
+def mod_time(mtime: float | None) -> str:
+    if mtime is None:
         return '?'
+    return datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M')
 
 
-def build_tree(base: Path, prefix: str = '', is_last: bool = True) -> list[str]:
-    """ファイルツリーを再帰的に構築する（.git 等を除外）"""
-    lines = []
-    items = sorted(base.iterdir(), key=lambda p: (p.is_file(), p.name.lower()))
-    items = [i for i in items if i.name not in EXCLUDE]
+def scan_tree(base: Path) -> tuple[list[str], list[FileRow]]:
+    """ファイルツリー行とファイル一覧を os.scandir の 1 パスで構築する（.git 等を除外）
+
+    DirEntry がディレクトリ読み取り時にキャッシュした種別・stat を使うため、
+    rglob + Path.stat() の二重走査を行わない。
+
+    Returns:
+      (ツリー行, [FileRow, ...])
+    """
+    tree_lines: list[str] = []
+    files: list[FileRow] = []
+    describe = FILE_DESCRIPTIONS.get
+    base_str = str(base)
+    root_len = len(base_str) + len(os.sep)   # entry.path[root_len:] が ROOT からの相対パス
+
+    def _walk(dir_path: str, prefix: str) -> None:
+        with os.scandir(dir_path) as it:
+            entries = sorted((e for e in it if e.name not in EXCLUDE),
+                             key=lambda e: (e.is_file(), e.name.lower()))
 
-    for idx, item in enumerate(items):
-        last = (idx == len(items) - 1)
-        connector = '└── ' if last else '├── '
-        ext_prefix = '    ' if last else '│   '
+        for idx, entry in enumerate(entries):
+            last = (idx == len(entries) - 1)
+            connector = '└── ' if last else '├── '
+            ext_prefix = '    ' if last else '│   '
 
-        if item.is_dir():
-            lines.append(f'{prefix}{connector}{item.name}/')
-            lines.extend(build_tree(item, prefix + ext_prefix, last))
-        else:
-            lines.append(f'{prefix}{connector}{item.name}')
+            if entry.is_dir(follow_symlinks=False):
+                tree_lines.append(f'{prefix}{connector}{entry.name}/')
+                _walk(entry.path, prefix + ext_prefix)
+            else:
+                tree_lines.append(f'{prefix}{connector}{entry.name}')
+                if entry.is_file():
+                    try:
+                        st = entry.stat()
+                        size, mtime = st.st_size, st.st_mtime
+                    except OSError:
+                        size = mtime = None
+                    files.append(FileRow(entry.name, entry.path[root_len:], size, mtime,
+                                         describe(entry.name, '')))
 
-    return lines
+    _walk(base_str, '')
+    # 浅い階層 → 名前順
+    files.sort(key=lambda f: (f.rel.count(os.sep), f.name.lower()))
+    return tree_lines, files
+
+
+@functools.lru_cache(maxsize=None)
+def _launchctl_is_loaded(label: str) -> bool:
+    """`launchctl list <label>` の終了コードで登録有無を判定する（ラベルごとに 1 回だけ実行）"""
+    r = subprocess.run(['launchctl', 'list', label],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return r.returncode == 0
 
 
 def launchd_status() -> dict[str, str]:
@@ -93,14 +137,11 @@ def launchd_status() -> dict[str, str]:
     }
     result = {}
     try:
-        out = subprocess.check_output(['launchctl', 'list'], text=True, stderr=subprocess.DEVNULL)
-        loaded = set()
-        for line in out.splitlines():
-            for job in jobs:
-                if job in line:
-                    loaded.add(job)
+        # 全ジョブの一覧を取得・解析せず、対象ラベルだけを並列に問い合わせる
+        with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+            loaded = dict(zip(jobs, pool.map(_launchctl_is_loaded, jobs)))
         for job, desc in jobs.items():
-            status = '✅ 登録済み' if job in loaded else '❌ 未登録'
+            status = '✅ 登録済み' if loaded[job] else '❌ 未登録'
             result[job] = f'{status} — {desc}'
     except Exception:
         for job, desc in jobs.items():
@@ -108,10 +149,41 @@ def launchd_status() -> dict[str, str]:
     return result
 
 
-def generate() -> str:
+def _signature(tree_lines: list[str], files: list[FileRow], status: dict[str, str]) -> str:
+    """出力内容を左右する情報（ツリー・サイズ・mtime・launchd 状態）のハッシュ。
+    STRUCTURE.md 自身は書き込むたびに変わるので除外する。"""
+    out_rel = os.path.relpath(OUTPUT, ROOT)
+    h = hashlib.blake2b(digest_size=16)
+    h.update('\n'.join(tree_lines).encode('utf-8'))
+    h.update(''.join(f'\n{r.rel}|{r.size}|{r.mtime}' for r in files if r.rel != out_rel).encode('utf-8'))
+    h.update(''.join(f'\n{job}|{st}' for job, st in status.items()).encode('utf-8'))
+    return h.hexdigest()
+
+
+def _previous_signature() -> str | None:
+    """既存 STRUCTURE.md の先頭行 `<!-- sig: ... -->` から前回のシグネチャを読む"""
+    try:
+        with open(OUTPUT, encoding='utf-8') as f:
+            first = f.readline().strip()
+    except OSError:
+        return None
+    if first.startswith('<!-- sig: ') and first.endswith(' -->'):
+        return first[len('<!-- sig: '):-len(' -->')]
+    return None
+
+
+def generate(force: bool = False) -> str | None:
+    """STRUCTURE.md の内容を返す。前回生成時から変化がなければ None（force=True で常に生成）"""
+    tree_lines, all_files = scan_tree(ROOT)
+    status = launchd_status()
+    sig = _signature(tree_lines, all_files, status)
+    if not force and sig == _previous_signature():
+        return None
+
     now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
     lines = []
+    lines.append(f'<!-- sig: {sig} -->')
     lines.append('# attendance-pwa ディレクトリ構成')
     lines.append('')
     lines.append(f'> 最終更新: {now}  ')
@@ -123,7 +195,6 @@ def generate() -> str:
     lines.append('')
     lines.append('```')
     lines.append('attendance-pwa/')
-    tree_lines = build_tree(ROOT)
     lines.extend(tree_lines)
     lines.append('```')
     lines.append('')
@@ -134,18 +205,12 @@ def generate() -> str:
     lines.append('| ファイル | サイズ | 最終更新 | 説明 |')
     lines.append('|---|---|---|---|')
 
-    all_files = sorted(
-        [p for p in ROOT.rglob('*') if p.is_file()
-         and not any(ex in p.parts for ex in EXCLUDE)],
-        key=lambda p: (len(p.relative_to(ROOT).parts), p.name.lower())
-    )
-    for f in all_files:
-        rel = f.relative_to(ROOT)
-        name = str(rel)
-        desc = FILE_DESCRIPTIONS.get(f.name, '')
-        size = human_size(f)
-        mt = mod_time(f)
-        lines.append(f'| `{name}` | {size} | {mt} | {desc} |')
+    # 行ごとに append せず、表本体を 1 つの文字列として組み立てて追加する
+    if all_files:
+        lines.append('\n'.join([
+            f'| `{r.rel}` | {human_size(r.size)} | {mod_time(r.mtime)} | {r.desc} |'
+            for r in all_files
+        ]))
 
     lines.append('')
 
@@ -170,7 +235,6 @@ def generate() -> str:
     # ===== launchd 状態 =====
     lines.append('## launchd 自動化ジョブ状態')
     lines.append('')
-    status = launchd_status()
     for job, desc in status.items():
         lines.append(f'- **{job}**: {desc}')
     lines.append('')
@@ -213,7 +277,11 @@ def generate() -> str:
 
 
 if __name__ == '__main__':
-    content = generate()
+    import sys
+    content = generate(force='--force' in sys.argv[1:])
+    if content is None:
+        print(f'STRUCTURE.md は最新です（変更なし、スキップ）: {OUTPUT}')
+        sys.exit(0)
     OUTPUT.write_text(content, encoding='utf-8')
     print(f'✅ STRUCTURE.md を生成しました: {OUTPUT}')
     print(f'   {len(content.splitlines())} 行')
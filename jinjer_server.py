@@ -15,16 +15,35 @@ jinjer同期サーバー — PWAからのTailscale経由リクエストに応答
   GET  /api/structure                    STRUCTURE.md の内容
   GET  /api/jobs?categories=1,2,3&keywords=Python&platforms=crowdworks,lancers  案件一覧
 
+  JSON レスポンスは compact 形式。?pretty=1 を付けると indent=2 で整形して返す。
+  1KB を超える JSON は Accept-Encoding に応じて br / gzip で圧縮して返す。
+
 必要なパッケージ:
   pip install playwright openpyxl
   playwright install chromium
+  pip install -r requirements-optional.txt  # 以下の任意パッケージをまとめて入れる場合
+  pip install orjson      # 任意: JSON エンコード高速化（未インストールなら標準 json）
+  pip install brotli      # 任意: Accept-Encoding: br 対応（未インストールなら gzip のみ）
+  pip install lxml        # 任意: 案件フィードの XML パース高速化（未インストールなら ElementTree）
+  pip install pyahocorasick  # 任意: 案件キーワード照合の高速化（未インストールなら逐次 in 判定）
+  pip install google-re2  # 任意: 案件要約の HTML タグ除去を線形時間で（未インストールなら標準 re）
+  pip install psutil      # 任意: 起動時のポート占有プロセス検出（未インストールなら lsof / fuser / ss）
 """
 import asyncio
+import atexit
+import codecs
 import errno as _errno
+import gzip
+import hashlib
+import http.client
 import json
 import os
+import queue
 import re
+import selectors
 import signal as _signal
+import socket
+import stat as _stat
 import subprocess
 import sys
 import threading
@@ -32,36 +51,583 @@ import time
 import urllib.request
 import xml.etree.ElementTree as ET
 import shutil
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime as _dt, timedelta as _td
-from http.server import BaseHTTPRequestHandler, HTTPServer
-from socketserver import ThreadingMixIn
-from urllib.parse import urlparse, parse_qs
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, urljoin, quote
 from pathlib import Path
 
 _HERE = Path(__file__).parent
+_HERE_RESOLVED = _HERE.resolve()   # パストラバーサル判定の基準 (リクエストごとに realpath しない)
 sys.path.insert(0, str(_HERE))
 
 try:
-    from sync_jinjer import scrape_months, convert_all, save_to_icloud_and_local
-    _SCRAPER_OK = True
-except ImportError as e:
-    print(f'[ERROR] sync_jinjer.py のインポートに失敗: {e}')
-    _SCRAPER_OK = False
+    import orjson
+    _ORJSON_OK = True
+except ImportError:
+    orjson = None            # type: ignore
+    _ORJSON_OK = False
 
 try:
-    from report_sync import (
-        list_reports, read_report,
-        write_report_from_kintai, create_next_month_report,
-    )
-    _REPORT_OK = True
-except (ImportError, SystemExit) as e:
-    print(f'[WARN] report_sync.py のインポートに失敗 (報告書機能は無効): {e}')
-    _REPORT_OK = False
+    from lxml import etree as _lxml_etree
+    _LXML_OK = True
+except ImportError:
+    _lxml_etree = None       # type: ignore
+    _LXML_OK = False
+
+try:
+    import ahocorasick
+    _AHOCORASICK_OK = True
+except ImportError:
+    ahocorasick = None       # type: ignore
+    _AHOCORASICK_OK = False
+
+try:
+    import psutil
+    _PSUTIL_OK = True
+except ImportError:
+    psutil = None            # type: ignore
+    _PSUTIL_OK = False
+
+try:
+    import re2
+    _RE2_OK = True
+except ImportError:
+    re2 = None               # type: ignore
+    _RE2_OK = False
+
+try:
+    import brotli
+    _BROTLI_OK = True
+except ImportError:
+    brotli = None            # type: ignore
+    _BROTLI_OK = False
+
+
+def _json_dumps(data, pretty: bool = False) -> bytes:
+    """data を UTF-8 の JSON バイト列にする。orjson があれば使い、なければ標準 json。"""
+    if _ORJSON_OK:
+        option = orjson.OPT_NON_STR_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, option=option)
+    if pretty:
+        return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _json_cache_entry(data) -> dict:
+    """レスポンスキャッシュ用エントリ。エンコード済み body と ETag を一緒に保持する。"""
+    body = _json_dumps(data)
+    etag = 'W/"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+    return {'ts': time.time(), 'data': data, 'body': body, 'etag': etag}
+
+
+# テキストファイル (STRUCTURE.md 等) の gzip 済みバイト列: path → (mtime_ns, size, gzip bytes)
+_gzip_file_cache: dict[str, tuple[int, int, bytes]] = {}
+
+
+def _gzip_file_cached(path: Path, f, st: os.stat_result) -> bytes:
+    """開いているファイル f を gzip した結果を返す。mtime / size が変わらない限り再圧縮しない。"""
+    key = str(path)
+    hit = _gzip_file_cache.get(key)
+    if hit and hit[0] == st.st_mtime_ns and hit[1] == st.st_size:
+        return hit[2]
+    gz = gzip.compress(f.read(), compresslevel=5)
+    _gzip_file_cache[key] = (st.st_mtime_ns, st.st_size, gz)
+    return gz
+
+
+# 静的ファイル (index.html 等) のキャッシュ: 実パス → (mtime_ns, size, body, ETag, {Content-Encoding: 圧縮済み bytes})
+# 配信対象は do_GET の固定リストのみなので件数上限は設けない
+_static_cache: dict[str, tuple[int, int, bytes, str, dict]] = {}
+
+
+def _static_cached(path: Path, st: os.stat_result) -> tuple[bytes, str, dict]:
+    """静的ファイルの (body, ETag, 圧縮済み辞書) を返す。mtime / size が変わらない限り読み直さない。"""
+    key = str(path)
+    hit = _static_cache.get(key)
+    if hit and hit[0] == st.st_mtime_ns and hit[1] == st.st_size:
+        return hit[2], hit[3], hit[4]
+    body = path.read_bytes()
+    etag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+    compressed: dict[str, bytes] = {}
+    _static_cache[key] = (st.st_mtime_ns, st.st_size, body, etag, compressed)
+    return body, etag, compressed
+
+
+def _tail_lines(path: Path, n: int, block: int = 8192) -> list[str]:
+    """ファイル末尾から n 行を返す (tail -n)。末尾からブロック単位で遡り、必要な分だけ読んでデコードする。"""
+    with open(path, 'rb') as f:
+        pos = f.seek(0, os.SEEK_END)
+        chunks: list[bytes] = []
+        newlines = 0
+        # 末尾の改行ぶん +1。n 行の先頭より前の改行が見つかるまで遡る
+        while pos > 0 and newlines <= n:
+            step = min(block, pos)
+            pos -= step
+            f.seek(pos)
+            chunk = f.read(step)
+            chunks.append(chunk)
+            newlines += chunk.count(b'\n')
+    data = b''.join(reversed(chunks))
+    if pos > 0:
+        # 途中から読んだ先頭の 1 行は欠けているので捨てる
+        data = data[data.find(b'\n') + 1:]
+    lines = data.decode('utf-8', errors='replace').splitlines()
+    return lines[-n:] if n > 0 else []
+
+
+# ログの行数カウント: パス → (inode, 数え終えた位置, 改行数, 数え終えた位置の直前 64 バイト)。
+# ログは追記のみなので前回以降に増えた部分だけ数える。直前 64 バイトが変わっていれば
+# (ローテート・切り詰め後の再書き込み) 先頭から数え直す
+_log_line_counts: dict[str, tuple[int, int, int, bytes]] = {}
+
+
+def _count_lines(path: Path) -> int:
+    """ファイルの行数 (splitlines 相当: 末尾が改行で終わらなければ最終行も数える)"""
+    key = str(path)
+    with open(path, 'rb') as f:
+        st = os.fstat(f.fileno())
+        pos, count, tail = 0, 0, b''
+        prev = _log_line_counts.get(key)
+        if prev and prev[0] == st.st_ino and prev[1] <= st.st_size:
+            f.seek(prev[1] - len(prev[3]))
+            if f.read(len(prev[3])) == prev[3]:
+                _, pos, count, tail = prev
+        f.seek(pos)
+        while chunk := f.read(1 << 20):
+            count += chunk.count(b'\n')
+            tail = (tail + chunk)[-64:]
+            pos += len(chunk)
+    _log_line_counts[key] = (st.st_ino, pos, count, tail)
+    return count + (1 if tail and not tail.endswith(b'\n') else 0)
+
+
+# /api/files/read のレスポンスキャッシュ: (path パラメータ, 実パス) → (mtime_ns, size, _json_cache_entry)
+_files_read_cache: dict[tuple[str, str], tuple[int, int, dict]] = {}
+_FILES_READ_CACHE_MAX = 64
+_files_read_lock = threading.Lock()
+
+
+def _safe_path(rel: str) -> Path | None:
+    """_HERE 配下の実パスを返す。シンボリックリンク・.. で外に出る場合は None (パストラバーサル防止)"""
+    try:
+        target = (_HERE_RESOLVED / rel).resolve()
+        target.relative_to(_HERE_RESOLVED)
+    except (ValueError, OSError):
+        return None
+    return target
+
+
+def _json_loads(raw: bytes | str):
+    """JSON を読み込む。orjson があれば bytes のままデコードせずに渡す。"""
+    if _ORJSON_OK:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+# sync_jinjer / report_sync (openpyxl) は初回使用時に import する。
+# 起動直後にソケットを bind できるよう、重い依存の読み込みをサーバー起動後に回す。
+_SCRAPER_OK = None   # None: 未ロード / True: 利用可 / False: import 失敗
+_REPORT_OK  = None
+_import_lock = threading.Lock()
+
+
+def _ensure_scraper() -> bool:
+    """sync_jinjer を必要になった時点で import する。利用可能なら True。"""
+    global _SCRAPER_OK, scrape_months, convert_all, save_to_icloud_and_local
+    if _SCRAPER_OK is None:
+        with _import_lock:
+            if _SCRAPER_OK is None:
+                try:
+                    from sync_jinjer import scrape_months, convert_all, save_to_icloud_and_local
+                    _SCRAPER_OK = True
+                except ImportError as e:
+                    print(f'[ERROR] sync_jinjer.py のインポートに失敗: {e}')
+                    _SCRAPER_OK = False
+    return _SCRAPER_OK
+
+
+def _ensure_reports() -> bool:
+    """report_sync を必要になった時点で import する。利用可能なら True。"""
+    global _REPORT_OK, list_reports, read_report, write_report_from_kintai, create_next_month_report
+    if _REPORT_OK is None:
+        with _import_lock:
+            if _REPORT_OK is None:
+                try:
+                    from report_sync import (
+                        list_reports, read_report,
+                        write_report_from_kintai, create_next_month_report,
+                    )
+                    _REPORT_OK = True
+                except (ImportError, SystemExit) as e:
+                    print(f'[WARN] report_sync.py のインポートに失敗 (報告書機能は無効): {e}')
+                    _REPORT_OK = False
+    return _REPORT_OK
+
+
+# スクレイプ専用の常駐イベントループ。Chromium を 1 度だけ起動し、リクエストごとに
+# asyncio.run() でループとブラウザを作り直すコストを省く。
+_scrape_loop: asyncio.AbstractEventLoop | None = None
+_scrape_loop_lock = threading.Lock()
+
+
+def _get_scrape_loop() -> asyncio.AbstractEventLoop:
+    """常駐ループを（初回のみ）専用スレッドで起動して返す"""
+    global _scrape_loop
+    if _scrape_loop is None:
+        with _scrape_loop_lock:
+            if _scrape_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='scrape-loop', daemon=True).start()
+                atexit.register(_close_scrape_browser, loop)
+                _scrape_loop = loop
+    return _scrape_loop
+
+
+def _close_scrape_browser(loop: asyncio.AbstractEventLoop):
+    """終了時に共有 Chromium を閉じる"""
+    try:
+        from sync_jinjer import close_browser
+        asyncio.run_coroutine_threadsafe(close_browser(), loop).result(timeout=10)
+    except Exception:
+        pass
+
+
+SCRAPE_TIMEOUT = 180   # 1 回のスクレイプの上限 (秒)
+
+
+def _run_scrape(target_months: list) -> dict:
+    """常駐ループ上で scrape_months を実行し、結果を待つ。
+    SCRAPE_TIMEOUT を超えたらコルーチンをキャンセルし (ブラウザコンテキストは閉じられる)、例外にする。"""
+    coro = scrape_months(target_months, reuse_browser=True)
+    fut = asyncio.run_coroutine_threadsafe(coro, _get_scrape_loop())
+    try:
+        return fut.result(timeout=SCRAPE_TIMEOUT)
+    except TimeoutError:
+        fut.cancel()
+        raise RuntimeError(f'jinjer のスクレイプが {SCRAPE_TIMEOUT} 秒以内に終わりませんでした')
+
+class _TTLCache:
+    """件数上限つき・期限つきの LRU キャッシュ (cachetools.TTLCache 相当の最小実装)。
+    値は 'ts' キーを持つ dict (_json_cache_entry)。スレッドセーフではないので呼び出し側でロックすること。
+
+    stale > 0 なら期限切れ後も stale 秒間は get_stale() で古いエントリを返せる
+    (stale-while-revalidate: 古い結果を即返しつつ裏で取り直す)。
+    """
+
+    def __init__(self, maxsize: int, ttl: float, stale: float = 0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale = stale
+        self._data: OrderedDict = OrderedDict()
+
+    def get_stale(self, key):
+        """(エントリ, 期限内か) を返す。猶予期間も過ぎた・未登録なら (None, False)"""
+        entry = self._data.get(key)
+        if entry is None:
+            return None, False
+        age = time.time() - entry['ts']
+        if age >= self.ttl + self.stale:
+            del self._data[key]
+            return None, False
+        self._data.move_to_end(key)
+        return entry, age < self.ttl
+
+    def get(self, key):
+        """期限内のエントリを返す。期限切れ・未登録なら None"""
+        entry, fresh = self.get_stale(key)
+        return entry if fresh else None
+
+    def __setitem__(self, key, entry):
+        self._data[key] = entry
+        self._data.move_to_end(key)
+        # 猶予期間も過ぎたものを先頭 (古い順) から掃除し、それでも溢れたら最も使われていないものを捨てる
+        now = time.time()
+        keep = self.ttl + self.stale
+        while self._data:
+            oldest = next(iter(self._data.values()))
+            if now - oldest['ts'] < keep and len(self._data) <= self.maxsize:
+                break
+            self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+def _refresh_in_background(fn, *args):
+    """キャッシュの再取得をデーモンスレッドで行う (失敗はログのみ。待っている側には Future で伝わる)"""
+    def run():
+        try:
+            fn(*args)
+        except Exception as e:
+            print(f'[WARN] バックグラウンド再取得失敗 ({fn.__name__}): {e}', flush=True)
+    threading.Thread(target=run, name='cache-refresh', daemon=True).start()
+
 
 PORT = int(sys.argv[1]) if len(sys.argv) > 1 else 8899
 _START_TIME = time.time()           # uptime 計算用
-_cache = {}   # cache_key → { ts, data }
 CACHE_TTL = 300  # 5分
+# 期限切れ後も 3*TTL までは古い結果を即返し、裏でスクレイプし直す (スクレイプは数十秒かかるため)
+_cache = _TTLCache(maxsize=64, ttl=CACHE_TTL, stale=3 * CACHE_TTL)   # cache_key → _json_cache_entry() ({ ts, data, body, etag })
+# 再起動後の初回リクエストは前回スクレイプ結果 (attendance/jinjer/*.json) をディスクキャッシュとして使う
+CACHE_TTL_DISK_CURRENT = 3600        # 今月を含む場合: 1時間
+CACHE_TTL_DISK_PAST    = 7 * 86400   # 過去月のみ: 7日
+# _cache の check-then-populate を保護し、同じ月の同時スクレイプを 1 本にまとめる
+_cache_lock = threading.Lock()
+_inflight: dict[str, Future] = {}   # cache_key → 実行中スクレイプの結果
+INFLIGHT_WAIT_TIMEOUT = SCRAPE_TIMEOUT + 30   # 相乗りしたリクエストが結果を待つ上限 (秒)
+
+# ─────────────────────────────────────────────────────────
+# 外部コマンド結果の短期キャッシュ
+# ─────────────────────────────────────────────────────────
+# 外部コマンド (tailscale / docker) の結果を短時間使い回す: key → (取得時刻, 結果)
+_call_cache: dict = {}
+_call_locks: dict = {}
+_call_cache_lock = threading.Lock()
+
+
+def _cached_call(key, ttl: float, fn):
+    """fn() の結果を ttl 秒キャッシュして返す。同じ key の同時呼び出しは 1 回の実行にまとめる。
+    None (検出できなかった等) はキャッシュしない。"""
+    hit = _call_cache.get(key)
+    if hit is not None and time.time() - hit[0] < ttl:
+        return hit[1]
+    with _call_cache_lock:
+        lock = _call_locks.setdefault(key, threading.Lock())
+    with lock:
+        hit = _call_cache.get(key)
+        if hit is not None and time.time() - hit[0] < ttl:
+            return hit[1]
+        value = fn()
+        if value is not None:
+            _call_cache[key] = (time.time(), value)
+        return value
+
+
+def _drop_cached(*keys):
+    for key in keys:
+        _call_cache.pop(key, None)
+
+
+# ─────────────────────────────────────────────────────────
+# Docker Engine API (UNIX ソケット直結)
+# ─────────────────────────────────────────────────────────
+# ps / images / logs / start・stop のたびに docker CLI を fork+exec すると macOS では数百 ms かかるため、
+# デーモンのソケットに直接 HTTP を投げる。ソケットが見つからない環境 (DOCKER_HOST=tcp:// 等) は CLI に任せる
+_DOCKER_SOCK_CANDIDATES = (
+    '/var/run/docker.sock',
+    str(Path.home() / '.docker/run/docker.sock'),      # Docker Desktop (macOS)
+    str(Path.home() / '.colima/default/docker.sock'),
+    str(Path.home() / '.orbstack/run/docker.sock'),
+)
+_docker_conns = threading.local()   # スレッドごとの keep-alive 接続
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """UNIX ドメインソケットに接続する HTTPConnection"""
+
+    def __init__(self, path: str, timeout: float):
+        super().__init__('localhost', timeout=timeout)
+        self._sock_path = path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self._sock_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+def _find_docker_sock() -> str | None:
+    host = os.environ.get('DOCKER_HOST', '')
+    if host:
+        return host[len('unix://'):] if host.startswith('unix://') else None
+    return next((p for p in _DOCKER_SOCK_CANDIDATES if os.path.exists(p)), None)
+
+
+def _docker_sock() -> str | None:
+    """使える Docker ソケットのパス (なければ None)。デーモンが後から起動した場合に備え、未検出は毎回探し直す"""
+    return _cached_call('docker-sock', 60, _find_docker_sock)
+
+
+def _docker_api(method: str, path: str, timeout: float = 10) -> tuple[int, bytes]:
+    """Docker Engine API を呼んで (status, body) を返す。接続できなければ OSError"""
+    sock_path = _docker_sock()
+    if sock_path is None:
+        raise FileNotFoundError('Docker ソケットが見つかりません')
+    conn = getattr(_docker_conns, 'conn', None)
+    if conn is not None and conn._sock_path != sock_path:
+        conn.close()
+        conn = None
+    while True:
+        reused = conn is not None
+        if conn is None:
+            conn = _docker_conns.conn = _UnixHTTPConnection(sock_path, timeout)
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        try:
+            conn.request(method, path, headers={'Host': 'docker'})
+            res = conn.getresponse()
+            body = res.read()
+            break
+        except (http.client.HTTPException, OSError):
+            # デーモン側で切られた keep-alive 接続なら 1 回だけ張り直す
+            conn.close()
+            conn = _docker_conns.conn = None
+            if not reused:
+                raise
+    if res.will_close:
+        conn.close()
+        _docker_conns.conn = None
+    return res.status, body
+
+
+def _docker_api_json(method: str, path: str, timeout: float = 10, ok=(200,)):
+    """Docker Engine API を呼んで JSON を返す (本文が空なら None)。失敗時は RuntimeError"""
+    try:
+        status, body = _docker_api(method, path, timeout)
+    except (OSError, http.client.HTTPException) as e:
+        raise RuntimeError(f'Docker デーモンに接続できません: {e}') from e
+    if status not in ok:
+        raise RuntimeError(_docker_error_message(body) or f'Docker API {method} {path}: HTTP {status}')
+    return _json_loads(body) if body else None
+
+
+def _docker_error_message(body: bytes) -> str | None:
+    """エラー応答 {"message": ...} からメッセージを取り出す"""
+    try:
+        return _json_loads(body).get('message')
+    except Exception:
+        return None
+
+
+_docker_events_live = threading.Event()    # /events を購読中なら set (一覧キャッシュを長めに信用できる)
+_docker_events_started = threading.Lock()
+
+
+def _docker_watch_events():
+    """コンテナ・イメージの変化を /events で購読し、届くたびに一覧キャッシュを捨てる。
+    CLI / 他ツールからの操作も反映される。切れたら少し待って張り直す"""
+    filters = quote(json.dumps({'type': ['container', 'image']}))
+    while True:
+        sock_path = _docker_sock()
+        if sock_path is not None:
+            conn = _UnixHTTPConnection(sock_path, timeout=None)
+            try:
+                conn.request('GET', f'/events?filters={filters}', headers={'Host': 'docker'})
+                res = conn.getresponse()
+                if res.status == 200:
+                    _docker_events_live.set()
+                    _drop_cached('docker-ps', 'docker-images')   # 購読開始前の変化を取りこぼさない
+                    for _ in res:
+                        _drop_cached('docker-ps', 'docker-images')
+            except (OSError, http.client.HTTPException) as e:
+                # デーモン停止中は 30 秒ごとに失敗するので、購読できていた接続が切れたときだけ記録する
+                if _docker_events_live.is_set():
+                    print(f'[docker] events 購読が切れました: {e}', flush=True)
+            finally:
+                _docker_events_live.clear()
+                conn.close()
+        time.sleep(30)
+
+
+def _ensure_docker_watcher():
+    if _docker_events_started.acquire(blocking=False):
+        threading.Thread(target=_docker_watch_events, name='docker-events', daemon=True).start()
+
+
+def _docker_demux(data: bytes) -> str:
+    """logs API の多重化ストリーム (8 バイトヘッダ + 本文のフレーム列) を出力順につなげる。
+    TTY 付きコンテナはヘッダなしの生ストリームなのでそのまま返す"""
+    if len(data) < 8 or data[0] not in (0, 1, 2) or data[1:4] != b'\0\0\0':
+        return data.decode('utf-8', 'replace')
+    out = []
+    pos = 0
+    while pos + 8 <= len(data):
+        size = int.from_bytes(data[pos + 4:pos + 8], 'big')
+        out.append(data[pos + 8:pos + 8 + size])
+        pos += 8 + size
+    return b''.join(out).decode('utf-8', 'replace')
+
+
+_DOCKER_STREAMS = {0: 'stdin', 1: 'stdout', 2: 'stderr'}
+
+
+def _docker_log_lines(res):
+    """logs API のレスポンスを読みながら (ストリーム名, 1 行分の bytes) を順に返す。
+    全体をバッファせずフレーム (8 バイトヘッダ + 本文) ごとに読む。TTY 付きは生ストリームを stdout 扱い"""
+    head = res.read(8)
+    if len(head) == 8 and head[0] in (0, 1, 2) and head[1:4] == b'\0\0\0':
+        def frames():
+            h = head
+            while len(h) == 8:
+                yield h[0], res.read(int.from_bytes(h[4:8], 'big'))
+                h = res.read(8)
+    else:
+        def frames():
+            yield 1, head
+            while data := res.read1(65536):
+                yield 1, data
+    # 1 行がフレームをまたぐことがあるので、ストリームごとに行の途中を持ち越す
+    pending: dict[int, bytes] = {}
+    for stream, data in frames():
+        *lines, pending[stream] = (pending.get(stream, b'') + data).split(b'\n')
+        for line in lines:
+            yield _DOCKER_STREAMS.get(stream, 'stdout'), line
+    for stream, rest in pending.items():
+        if rest:
+            yield _DOCKER_STREAMS.get(stream, 'stdout'), rest
+
+
+def _docker_ports(ports: list) -> str:
+    """API の Ports を docker ps の表示 ("0.0.0.0:8080->80/tcp, 443/tcp") に整形する"""
+    shown = []
+    for p in sorted(ports, key=lambda p: (p.get('PrivatePort', 0), p.get('IP', ''))):
+        private = f"{p.get('PrivatePort')}/{p.get('Type', 'tcp')}"
+        if p.get('PublicPort'):
+            ip = p.get('IP') or '0.0.0.0'
+            host = f'[{ip}]' if ':' in ip else ip
+            private = f"{host}:{p['PublicPort']}->{private}"
+        if private not in shown:
+            shown.append(private)
+    return ', '.join(shown)
+
+
+def _human_size(n: float) -> str:
+    """docker images の SIZE 表示 (10 進・有効数字 3 桁: 1.23GB)"""
+    for unit in ('B', 'kB', 'MB', 'GB', 'TB'):
+        if n < 1000 or unit == 'TB':
+            return f'{n:.3g}{unit}'
+        n /= 1000
+
+
+def _human_since(ts: float) -> str:
+    """docker images の CREATED 表示 ("2 weeks ago" 等)"""
+    s = max(0, int(time.time() - ts))
+    h = round(s / 3600)
+    if s < 60:
+        text = 'Less than a second' if s < 1 else f'{s} seconds'
+    elif s < 3600:
+        text = 'About a minute' if s < 120 else f'{s // 60} minutes'
+    elif h < 48:
+        text = 'About an hour' if h == 1 else f'{h} hours'
+    elif h < 24 * 14:
+        text = f'{h // 24} days'
+    elif h < 24 * 60:
+        text = f'{h // (24 * 7)} weeks'
+    elif h < 24 * 365 * 2:
+        text = f'{h // (24 * 30)} months'
+    else:
+        text = f'{h // (24 * 365)} years'
+    return text + ' ago'
+
 
 # ─────────────────────────────────────────────────────────
 # .env 読み込み (起動時に一度だけ)
@@ -91,10 +657,63 @@ _TS_BINS = [
     '/Applications/Tailscale.app/Contents/MacOS/Tailscale',
     'tailscale',
 ]
+_TAILSCALE_TTL = 300   # DNS 名・IP はプロセス稼働中ほぼ変わらないので fork を繰り返さない
+
+
+def _tailscale_json(*args: str) -> dict | None:
+    """`tailscale <args> --json` の結果 (App Store 版 → Homebrew 版の順に試す)。_TAILSCALE_TTL 秒キャッシュ"""
+    def run():
+        for ts_bin in _TS_BINS:
+            try:
+                r = subprocess.run([ts_bin, *args, '--json'],
+                                   capture_output=True, text=True, timeout=5)
+                if r.returncode == 0 and r.stdout.strip():
+                    return json.loads(r.stdout)
+            except Exception:
+                continue
+        return None
+    return _cached_call(('tailscale',) + args, _TAILSCALE_TTL, run)
+
+
+def _tailscale_ipv4() -> str | None:
+    """`tailscale ip -4` の IPv4 アドレス (有効な IPv4 のみ採用)。_TAILSCALE_TTL 秒キャッシュ"""
+    def run():
+        for ts_bin in _TS_BINS:
+            try:
+                r = subprocess.run([ts_bin, 'ip', '-4'],
+                                   capture_output=True, text=True, timeout=5)
+                if r.returncode == 0:
+                    ip = r.stdout.strip().splitlines()[0].strip()
+                    if ip and _IPV4_RE.match(ip):
+                        return ip
+            except Exception:
+                continue
+        return None
+    return _cached_call(('tailscale', 'ip'), _TAILSCALE_TTL, run)
+
 
 # Cloudflare Quick Tunnel — 現在のURL を保持するグローバル変数
 _CF_TUNNEL_URL: str = ''
 
+# /api/health のレスポンス: 変化しないフィールドを前半としてエンコード済みで持ち、uptime だけ差し込む
+_health_prefix: tuple[tuple, bytes] = ((), b'')
+
+
+def _health_body(docker_info: str | None) -> bytes:
+    global _health_prefix
+    key = (_REPORT_OK, _SCRAPER_OK, docker_info, bool(_CF_TUNNEL_URL))
+    cached_key, prefix = _health_prefix
+    if cached_key != key:
+        prefix = _json_dumps({
+            'status':  'ok',
+            'report':  _REPORT_OK,
+            'scraper': _SCRAPER_OK,
+            'docker':  docker_info,   # "3/7" or null
+            'tunnel':  bool(_CF_TUNNEL_URL),
+        })[:-1] + b',"uptime_seconds":'
+        _health_prefix = (key, prefix)
+    return prefix + str(int(time.time() - _START_TIME)).encode() + b'}'
+
 # SSH 公開鍵追加レートリミット: {client_ip: [timestamp, ...]}
 _SSH_RATE: dict = {}
 _SSH_RATE_MAX    = 5   # 10分間の最大試行回数
@@ -119,10 +738,47 @@ DATA_DIR.mkdir(exist_ok=True)
 KINTAI_DATA_FILE = DATA_DIR / 'kintai_store.json'   # カレンダーデータ
 TASKS_DATA_FILE  = DATA_DIR / 'kintai_tasks.json'   # タスクデータ
 # ※ data/ は .gitignore で除外すること（個人データのため）
+DATA_BACKUP_GENERATIONS = 3        # 保存時に残す .bak<unixtime> の世代数
+_data_write_lock = threading.Lock()
+_bak_rings: dict[str, deque] = {}  # データファイル → 残しているバックアップ (古い順)。初回だけ glob する
+
+
+def _write_data_file(data_file: Path, content: bytes):
+    """データファイルを置き換える。直前の内容は .bak<unixtime> として残し、古い世代は削除する。
+
+    一時ファイルに書いてから os.replace するので、読み手が「ファイルなし」「書きかけ」を見ることはない。
+    バックアップは旧ファイルへのハードリンク (コピーしない。リンク不可の FS では copy2)。
+    """
+    with _data_write_lock:
+        key = str(data_file)
+        ring = _bak_rings.get(key)
+        if ring is None:
+            ring = _bak_rings[key] = deque(sorted(data_file.parent.glob(data_file.stem + '.bak*'),
+                                                  key=lambda p: p.stat().st_mtime))
+        if data_file.exists():
+            bak = data_file.with_suffix(f'.bak{int(time.time())}')
+            if not bak.exists():   # 同じ秒に保存済みならその時点のバックアップを残す
+                try:
+                    os.link(data_file, bak)
+                except OSError:
+                    shutil.copy2(data_file, bak)
+                ring.append(bak)
+        tmp = data_file.with_name(data_file.name + '.tmp')
+        tmp.write_bytes(content)
+        os.replace(tmp, data_file)
+        while len(ring) > DATA_BACKUP_GENERATIONS:
+            ring.popleft().unlink(missing_ok=True)
 
 # ===== フリーランス案件フィード =====
 JOBS_CACHE_TTL = 3600  # 1時間
-_jobs_cache: dict = {}
+FEED_MAX_ENTRIES = 100  # 1 フィードあたりに読む entry の上限（通常のフィードは数十件）
+# /api/jobs がフィード取得を待つ合計の上限 (秒)。ソケットの timeout は 1 回の読み書きごとなので、
+# 少しずつ返してくるサーバーだとそれだけでは止まらない。間に合わなかったフィードは裏で取得を続ける
+JOBS_FETCH_DEADLINE = 20
+# 期限切れ後も 2*TTL までは古い結果を即返し、裏で取り直す
+_jobs_cache = _TTLCache(maxsize=32, ttl=JOBS_CACHE_TTL, stale=JOBS_CACHE_TTL)
+_jobs_lock = threading.Lock()
+_jobs_inflight: dict[str, Future] = {}   # cache_key → 実行中のフィード取得
 
 # Crowdworks カテゴリ ID → 表示名
 CW_CATEGORIES = {
@@ -138,54 +794,204 @@ LANCERS_TYPES = {
     'web':    'Web制作',
     'app':    'アプリ開発',
 }
+# フィード取得を並列化する (合計待ち時間 = 各フィードの和 → 最大値)
+_JOBS_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix='jobs-fetch')
 _JOBS_UA = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (kintai-pwa/1.0)'
 _ATOM_NS = 'http://www.w3.org/2005/Atom'
+_Q_ENTRY = f'{{{_ATOM_NS}}}entry'
+_Q_LINK  = f'{{{_ATOM_NS}}}link'
+_Q_TEXT  = {f'{{{_ATOM_NS}}}{tag}': tag for tag in ('title', 'summary', 'content', 'updated', 'id')}
+_BUDGET_RE = re.compile(r'([\d,]+)\s*円')
+# タグ除去は要約全体に掛かるので、あれば線形時間の RE2 を使う (閉じない '<' が続いても二乗にならない)
+_TAG_RE    = (re2 if _RE2_OK else re).compile(r'<[^>]+>')
+_SUMMARY_LEN = 160
+_LOG_DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+_IPV4_RE     = re.compile(r'^(\d{1,3}\.){3}\d{1,3}$')
+_PID_RE      = re.compile(r'pid=(\d+)')
+_CF_URL_RE   = re.compile(rb'https://[a-z0-9\-]+\.trycloudflare\.com')
+_CF_URL_TIMEOUT = 30   # cloudflared がこの秒数内に URL を出さなければ諦めて止める
+# launchd は /usr/local/bin を PATH に含まないためフルパスも探す (起動時に 1 回だけ解決)
+_CF_CANDIDATES = (
+    '/usr/local/bin/cloudflared',
+    '/opt/homebrew/bin/cloudflared',
+    '/usr/bin/cloudflared',
+)
+_CF_BINARY = shutil.which('cloudflared') or next((p for p in _CF_CANDIDATES if os.path.exists(p)), None)
+
+
+# フィード取得用の keep-alive 接続 (スレッドごと・ホストごとに 1 本)。2 回目以降の TLS ハンドシェイクを省く
+_feed_conns = threading.local()
+
+
+def _feed_get(url: str, timeout: float = 12, parse=None, _redirects: int = 3):
+    """GET して本文を返す。接続はスレッド内でホスト単位に使い回す (3xx は追従、それ以外の非 200 は例外)
+
+    parse を渡すと、200 応答をバイト列に読み切らずレスポンス (ファイルライク) のまま parse に渡し、
+    その戻り値を返す。parse が途中で読むのをやめた残りは接続再利用のため読み捨てる。
+    """
+    u = urlparse(url)
+    conns = getattr(_feed_conns, 'by_host', None)
+    if conns is None:
+        conns = _feed_conns.by_host = {}
+    path = (u.path or '/') + (f'?{u.query}' if u.query else '')
+    headers = {'User-Agent': _JOBS_UA, 'Connection': 'keep-alive'}
+    while True:
+        conn = conns.get(u.netloc)
+        reused = conn is not None
+        if conn is None:
+            cls = http.client.HTTPSConnection if u.scheme == 'https' else http.client.HTTPConnection
+            conn = conns[u.netloc] = cls(u.netloc, timeout=timeout)
+        try:
+            conn.request('GET', path, headers=headers)
+            res = conn.getresponse()
+            if parse is not None and res.status == 200:
+                data = parse(res)
+                res.read()
+            else:
+                data = res.read()
+            break
+        except (http.client.HTTPException, OSError):
+            # サーバー側で切られた keep-alive 接続なら 1 回だけ張り直す
+            conn.close()
+            del conns[u.netloc]
+            if not reused:
+                raise
+        except Exception:
+            # パース失敗などで応答を読み切れていない接続は再利用しない
+            conn.close()
+            del conns[u.netloc]
+            raise
+    if res.will_close:
+        conn.close()
+        conns.pop(u.netloc, None)
+    if res.status in (301, 302, 303, 307, 308) and _redirects and res.getheader('Location'):
+        return _feed_get(urljoin(url, res.getheader('Location')), timeout, parse, _redirects - 1)
+    if res.status != 200:
+        raise RuntimeError(f'HTTP {res.status} {res.reason}')
+    return data
+
+
+def _atom_fields(entry) -> tuple[dict, str]:
+    """entry の子要素を 1 回だけ走査し、(タグ名 → テキスト, link href) を返す。
+    タグごとに findtext すると子要素をタグ数ぶん走査し直すため。先頭の要素を優先する。"""
+    fields: dict[str, str] = {}
+    href = None
+    for child in entry:
+        tag = child.tag
+        if tag == _Q_LINK:
+            if href is None:
+                href = child.get('href', '')
+            continue
+        name = _Q_TEXT.get(tag)
+        if name is not None and name not in fields:
+            fields[name] = child.text or ''
+    return fields, href or ''
+
+
+def _strip_tags(html: str, limit: int = _SUMMARY_LEN) -> str:
+    """HTML タグを除いた先頭 limit 文字を返す (_TAG_RE.sub('', html)[:limit] と同じ結果)。
+    要約に使うのは先頭だけなので、タグ以外の文字が limit に達した時点で走査をやめる。"""
+    parts: list[str] = []
+    n = 0
+    pos = 0
+    for m in _TAG_RE.finditer(html):
+        seg = html[pos:m.start()]
+        parts.append(seg)
+        n += len(seg)
+        pos = m.end()
+        if n >= limit:
+            break
+    else:
+        parts.append(html[pos:])
+    return ''.join(parts)[:limit]
+
+
+def _atom_job(entry, platform: str, category_label: str) -> dict:
+    """Atom の entry 要素 1 件を案件 dict にする"""
+    fields, url = _atom_fields(entry)
+    summary = fields.get('summary') or fields.get('content', '')
+    # 予算抽出（数字+円）
+    budget = ''
+    m = _BUDGET_RE.search(summary)
+    if m:
+        budget = f"¥{m.group(1)}"
+    title = fields.get('title', '').strip()
+    # HTMLタグ除去して短い要約を作成
+    clean = _strip_tags(summary).strip()
+    return {
+        'platform':    platform,
+        'category':    category_label,
+        'title':       title,
+        'url':         url,
+        'summary':     clean,
+        'budget':      budget,
+        'updated':     fields.get('updated', ''),
+        'id':          fields.get('id') or url,
+        'match_score': 0,
+        # キーワード照合用の小文字化テキスト (フィード取得時に 1 回だけ作る。応答には含めない)
+        '_search':     (title + ' ' + clean).lower(),
+    }
 
 
-def _atom_text(entry, tag: str) -> str:
-    return entry.findtext(f'{{{_ATOM_NS}}}{tag}', '') or ''
-
+def _parse_atom_stream(res, platform: str, category_label: str,
+                       max_entries: int = FEED_MAX_ENTRIES) -> list:
+    """Atom フィードを受信しながら逐次パースして案件リストを返す
 
-def _parse_atom_feed(data: bytes, platform: str, category_label: str) -> list:
-    """Atom XML バイト列をパースして案件リストを返す"""
-    root = ET.fromstring(data)
-    jobs = []
-    for entry in root.findall(f'{{{_ATOM_NS}}}entry'):
-        title   = _atom_text(entry, 'title').strip()
-        link_el = entry.find(f'{{{_ATOM_NS}}}link')
-        url     = (link_el.get('href', '') if link_el is not None else '')
-        summary = (_atom_text(entry, 'summary') or _atom_text(entry, 'content'))
-        updated = _atom_text(entry, 'updated')
-        uid     = _atom_text(entry, 'id') or url
-        # 予算抽出（数字+円）
-        budget = ''
-        m = re.search(r'([\d,]+)\s*円', summary)
-        if m:
-            budget = f"¥{m.group(1)}"
-        # HTMLタグ除去して短い要約を作成
-        clean = re.sub(r'<[^>]+>', '', summary)[:160].strip()
-        jobs.append({
-            'platform':    platform,
-            'category':    category_label,
-            'title':       title,
-            'url':         url,
-            'summary':     clean,
-            'budget':      budget,
-            'updated':     updated,
-            'id':          uid,
-            'match_score': 0,
-        })
+    DOM 全体を作らず、entry の終了タグごとに案件化して要素を破棄する。
+    max_entries 件に達したら残りはパースしない。
+    """
+    if _LXML_OK:
+        # 外部エンティティ・ネットワークアクセスを無効化 (ElementTree と同じ安全側の挙動)
+        parser = _lxml_etree.XMLPullParser(events=('end',), tag=_Q_ENTRY,
+                                           resolve_entities=False, no_network=True)
+    else:
+        parser = ET.XMLPullParser(events=('end',))
+    jobs: list = []
+    while True:
+        chunk = res.read1(65536)
+        if not chunk:
+            break
+        parser.feed(chunk)
+        for _, elem in parser.read_events():
+            if elem.tag != _Q_ENTRY:
+                continue
+            jobs.append(_atom_job(elem, platform, category_label))
+            elem.clear()
+            if _LXML_OK:
+                # 処理済みの entry を親から外す (clear だけでは空要素が root に残り続ける)
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+            if len(jobs) >= max_entries:
+                return jobs
+    parser.close()
     return jobs
 
 
+def _keyword_scorer(keywords: list):
+    """text → 含まれるキーワード数 を返す関数を作る。
+    キーワードが 3 つ以上で pyahocorasick があれば、1 パスの Aho-Corasick で数える。"""
+    if not _AHOCORASICK_OK or len(keywords) <= 2:
+        return lambda text: sum(1 for kw in keywords if kw in text)
+    counts: dict[str, int] = {}
+    for kw in keywords:
+        counts[kw] = counts.get(kw, 0) + 1
+    automaton = ahocorasick.Automaton()
+    for kw in counts:
+        automaton.add_word(kw, kw)
+    automaton.make_automaton()
+
+    def score(text: str) -> int:
+        return sum(counts[kw] for kw in {kw for _, kw in automaton.iter(text)})
+    return score
+
+
 def _fetch_cw_feed(cat_id: str) -> list:
     """Crowdworks カテゴリ Atom フィードを取得してパース"""
     url = f'https://crowdworks.jp/public/jobs/category/{cat_id}.atom'
     try:
-        req = urllib.request.Request(url, headers={'User-Agent': _JOBS_UA})
-        with urllib.request.urlopen(req, timeout=12) as res:
-            data = res.read()
-        return _parse_atom_feed(data, 'crowdworks', CW_CATEGORIES.get(cat_id, cat_id))
+        label = CW_CATEGORIES.get(cat_id, cat_id)
+        return _feed_get(url, timeout=12,
+                         parse=lambda res: _parse_atom_stream(res, 'crowdworks', label))
     except Exception as e:
         print(f'[jobs] CW cat={cat_id}: {e}')
         return []
@@ -195,69 +1001,346 @@ def _fetch_lancers_feed(work_type: str) -> list:
     """Lancers 検索 Atom フィードを取得してパース"""
     url = f'https://www.lancers.jp/work/search.atom?work_type[]={work_type}&order=new'
     try:
-        req = urllib.request.Request(url, headers={'User-Agent': _JOBS_UA})
-        with urllib.request.urlopen(req, timeout=12) as res:
-            data = res.read()
-        return _parse_atom_feed(data, 'lancers', LANCERS_TYPES.get(work_type, work_type))
+        label = LANCERS_TYPES.get(work_type, work_type)
+        return _feed_get(url, timeout=12,
+                         parse=lambda res: _parse_atom_stream(res, 'lancers', label))
     except Exception as e:
         print(f'[jobs] Lancers type={work_type}: {e}')
         return []
 
 
+# フィード単位の結果キャッシュと取得中 Future。条件 (カテゴリの組み合わせ・キーワード) が違うリクエスト
+# 同士でも、同じフィードは 1 回だけ取得して共有する
+_feed_cache = _TTLCache(maxsize=32, ttl=JOBS_CACHE_TTL)
+_feed_inflight: dict[tuple, Future] = {}
+
+
+def _submit_feed(fetch, arg: str) -> Future:
+    """フィード取得を _JOBS_POOL に投入する。キャッシュ済み・取得中なら既存の結果 / Future を返す"""
+    key = (fetch.__name__, arg)
+    with _jobs_lock:
+        entry = _feed_cache.get(key)
+        if entry is not None:
+            fut = Future()
+            fut.set_result(entry['jobs'])
+            return fut
+        fut = _feed_inflight.get(key)
+        if fut is None:
+            fut = _feed_inflight[key] = _JOBS_POOL.submit(_fetch_feed_shared, fetch, arg, key)
+        return fut
+
+
+def _fetch_feed_shared(fetch, arg: str, key: tuple) -> list:
+    jobs = []
+    try:
+        jobs = fetch(arg)
+        return jobs
+    finally:
+        # 例外でも取得中の登録は外す (残ると以降のリクエストが同じ失敗 Future を受け取り続ける)
+        with _jobs_lock:
+            if jobs:   # 取得失敗 ([]) はキャッシュしない
+                _feed_cache[key] = {'ts': time.time(), 'jobs': jobs}
+            _feed_inflight.pop(key, None)
+
+
+def _collect_jobs(platforms: list, cat_ids: list, keywords: list) -> tuple[list, bool]:
+    """各フィードを並列取得し、キーワードスコア順 (キーワードなしなら更新日時順) に並べて返す。
+    戻り値は (案件一覧, 全フィードが JOBS_FETCH_DEADLINE 内に揃ったか)。"""
+    futs = []
+    if 'crowdworks' in platforms:
+        futs += [_submit_feed(_fetch_cw_feed, cat) for cat in cat_ids]
+    if 'lancers' in platforms:
+        futs += [_submit_feed(_fetch_lancers_feed, wtype) for wtype in ['system', 'web', 'app']]
+    # 取得関数は失敗時に [] を返すので、投入順に結果をまとめる (順序は逐次版と同じ)。
+    # フィードの結果は他のリクエストと共有しているので、match_score を書き込む前に複製する
+    all_jobs: list = []
+    texts: list = []
+    complete = True
+    deadline = time.monotonic() + JOBS_FETCH_DEADLINE
+    for fut in futs:
+        try:
+            jobs = fut.result(timeout=max(0, deadline - time.monotonic()))
+        except TimeoutError:
+            complete = False
+            continue
+        for job in jobs:
+            job = dict(job)
+            texts.append(job.pop('_search'))
+            all_jobs.append(job)
+
+    # キーワードマッチスコアを計算してフィルタリング
+    if keywords:
+        score = _keyword_scorer(keywords)
+        for job, text in zip(all_jobs, texts):
+            job['match_score'] = score(text)
+        all_jobs.sort(key=lambda j: (-j['match_score'], j.get('updated', '')))
+    else:
+        all_jobs.sort(key=lambda j: j.get('updated', ''), reverse=True)
+    if not complete:
+        print(f'[jobs] {JOBS_FETCH_DEADLINE} 秒以内に取得できなかったフィードを除いて返します')
+    return all_jobs, complete
+
+
+JOBS_MAX_VIEWS = 8   # 1 エントリあたりに保持する ?fields= 射影の数
+
+
+def _jobs_view(entry: dict, fields: tuple) -> dict:
+    """?fields= で指定された項目だけに絞ったレスポンスエントリを返す (fields が空なら entry そのもの)。
+    射影結果は元エントリにぶら下げて再利用するので、ポーリングでも毎回エンコードし直さず ETag も効く。"""
+    if not fields:
+        return entry
+    views = entry.setdefault('views', {})
+    view = views.get(fields)
+    if view is None:
+        data = entry['data']
+        view = _json_cache_entry({
+            **data,
+            'jobs': [{k: job[k] for k in fields if k in job} for job in data['jobs']],
+        })
+        if len(views) < JOBS_MAX_VIEWS:
+            views[fields] = view
+    return view
+
+
+def _refresh_jobs(cache_key: str, platforms: list, cat_ids: list, keywords: list, fut: Future) -> dict:
+    """案件一覧を取得して _jobs_cache を更新し、fut で待っている側にも結果を渡す"""
+    try:
+        all_jobs, complete = _collect_jobs(platforms, cat_ids, keywords)
+        entry = _json_cache_entry({
+            'jobs':       all_jobs,
+            'total':      len(all_jobs),
+            'fetched_at': _dt.now().isoformat(),
+        })
+        with _jobs_lock:
+            # 欠けた結果は TTL いっぱい残さない。次のリクエストは取得済みのフィードを _feed_cache から、
+            # 遅れているフィードは取得中の Future を共有して組み立て直す
+            if complete:
+                _jobs_cache[cache_key] = entry
+            _jobs_inflight.pop(cache_key, None)
+        fut.set_result(entry)
+        return entry
+    except Exception as e:
+        if not fut.done():
+            fut.set_exception(e)
+        raise
+    finally:
+        with _jobs_lock:
+            if _jobs_inflight.get(cache_key) is fut:
+                del _jobs_inflight[cache_key]
+
+
+def _jinjer_sync_filename(target_months: list) -> str:
+    """スクレイプ結果の保存ファイル名 (sync_jinjer.save_to_icloud_and_local と同じ規則)"""
+    if len(target_months) == 1:
+        return f'jinjer_sync_{target_months[0]}.json'
+    return f'jinjer_sync_{target_months[0]}_to_{target_months[-1]}.json'
+
+
+def _load_jinjer_disk_cache(target_months: list):
+    """前回のスクレイプ結果を attendance/jinjer/ から読み込む。
+    期限切れ・対象月が一致しない・読み込めない場合は None を返す。
+    """
+    path = ICLOUD_JINJER_DIR / _jinjer_sync_filename(target_months)
+    try:
+        mtime = path.stat().st_mtime
+    except OSError:
+        return None
+    from datetime import date
+    ttl = (CACHE_TTL_DISK_CURRENT if date.today().strftime('%Y-%m') in target_months
+           else CACHE_TTL_DISK_PAST)
+    if time.time() - mtime >= ttl:
+        return None
+    try:
+        data = _json_loads(path.read_bytes())
+    except (OSError, ValueError):
+        return None
+    # 複数月のファイル名は先頭〜末尾月しか表さないため、中身の月構成で照合する
+    if not isinstance(data, dict) or set(data.get('months') or {}) != set(target_months):
+        return None
+    return data
+
+
 def _save_to_icloud(target_months: list, pwa_data: dict):
     """スクレイプ結果を iCloud Drive の kintai フォルダに保存する (旧互換)"""
     try:
         ICLOUD_DIR.mkdir(parents=True, exist_ok=True)
-        if len(target_months) == 1:
-            filename = f'jinjer_sync_{target_months[0]}.json'
-        else:
-            filename = f'jinjer_sync_{target_months[0]}_to_{target_months[-1]}.json'
-        content = json.dumps(pwa_data, ensure_ascii=False, indent=2)
+        filename = _jinjer_sync_filename(target_months)
         icloud_path = ICLOUD_DIR / filename
-        icloud_path.write_text(content, encoding='utf-8')
+        icloud_path.write_bytes(_json_dumps(pwa_data, pretty=True))
         print(f'☁️  iCloud Drive (旧) → {icloud_path}')
     except Exception as e:
         print(f'⚠️  iCloud Driveへの保存失敗: {e}')
 
 
-def _icloud_backup(kintai_data: dict, label: str = '') -> dict:
+_jinjer_save_lock = threading.Lock()   # 同じファイルへの同時書き込みを防ぐ
+
+
+def _save_jinjer_result(target_months: list, entry: dict):
+    """スクレイプ結果を iCloud + ローカルに保存する (応答済みのエンコード済み body を再利用)"""
+    with _jinjer_save_lock:
+        try:
+            save_to_icloud_and_local(target_months, entry['data'], content=entry['body'])
+        except Exception as save_e:
+            print(f'[WARN] iCloud保存失敗: {save_e}')
+
+
+def _refresh_jinjer(cache_key: str, target_months: list, fut: Future) -> dict:
+    """ディスクキャッシュまたはスクレイプで勤怠を取得して _cache を更新し、fut で待っている側にも結果を渡す"""
+    try:
+        pwa_data = _load_jinjer_disk_cache(target_months)
+        scraped = pwa_data is None
+        if scraped:
+            print(f'[scrape] {target_months}')
+            all_rows = _run_scrape(target_months)
+            pwa_data = convert_all(all_rows)
+        else:
+            print(f'[disk cache hit] {cache_key}')
+        # エンコード済み body も保持し、キャッシュヒット時の再シリアライズを省く
+        entry = _json_cache_entry(pwa_data)
+        with _cache_lock:
+            _cache[cache_key] = entry
+            _inflight.pop(cache_key, None)
+        fut.set_result(entry)
+        if scraped:
+            # iCloud + ローカル保存はバックグラウンドで行う (応答を待たせない)
+            threading.Thread(target=_save_jinjer_result, args=(target_months, entry),
+                             name='jinjer-save', daemon=True).start()
+        return entry
+    except Exception as e:
+        if not fut.done():
+            fut.set_exception(e)
+        raise
+    finally:
+        with _cache_lock:
+            if _inflight.get(cache_key) is fut:
+                del _inflight[cache_key]
+
+
+# _list_json_files(cache=True) の結果: (dir, prefix) → (ディレクトリの mtime_ns, 一覧)
+_dir_list_cache: dict[tuple[str, str], tuple[int, list]] = {}
+
+
+def _list_json_files(dir_path: Path, prefix: str = '', cache: bool = False) -> list:
+    """dir_path 直下の prefix*.json を新しい順に [{name, size_kb, mtime}] で返す (無ければ [])。
+    scandir 1 回 + ファイルごとに stat 1 回で済ませる (glob + ソートキーと本体で stat 2 回だったため)。
+
+    cache=True は、ファイルが上書きされず作成・削除だけされるディレクトリ (Backup/ の世代ファイル) 用。
+    ディレクトリの mtime が前回と同じなら stat 1 回で前回の一覧を返す。
+    上書き保存されるファイル (jinjer/) はディレクトリの mtime が変わらないので使わないこと。
+    """
+    key = (str(dir_path), prefix)
+    if cache:
+        try:
+            dir_mtime = os.stat(dir_path).st_mtime_ns
+        except FileNotFoundError:
+            return []
+        hit = _dir_list_cache.get(key)
+        if hit and hit[0] == dir_mtime:
+            return hit[1]
+    files = []
+    try:
+        with os.scandir(dir_path) as it:
+            for e in it:
+                # glob と同じく隠しファイル (iCloud の .icloud プレースホルダ等) は除く
+                if (e.name.startswith(prefix) and e.name.endswith('.json')
+                        and not e.name.startswith('.') and e.is_file()):
+                    files.append((e.name, e.stat()))
+    except FileNotFoundError:
+        return []
+    files.sort(key=lambda f: f[1].st_mtime, reverse=True)
+    listing = [{
+        'name':    name,
+        'size_kb': round(st.st_size / 1024, 1),
+        'mtime':   _dt.fromtimestamp(st.st_mtime).isoformat(),
+    } for name, st in files]
+    if cache:
+        _dir_list_cache[key] = (dir_mtime, listing)
+    return listing
+
+
+# バックアップファイルの月一覧: path → (mtime_ns, size, months)。変わっていなければ再パースしない
+_backup_months_cache: dict[str, tuple[int, int, list]] = {}
+
+
+def _backup_months(path: Path, st: os.stat_result, raw: bytes | None = None) -> list | None:
+    """バックアップ JSON (raw) の months のキー一覧。パースで JSON としての妥当性も確かめる。
+    raw を省略するとキャッシュにあるときだけ返す (なければ None)"""
+    hit = _backup_months_cache.get(str(path))
+    if hit and hit[0] == st.st_mtime_ns and hit[1] == st.st_size:
+        return hit[2]
+    if raw is None:
+        return None
+    months = list(_json_loads(raw).get('months', {}).keys())
+    _backup_months_cache[str(path)] = (st.st_mtime_ns, st.st_size, months)
+    return months
+
+
+# 直近に iCloud へ書いた attendance_backup.json の内容ハッシュ (None: 起動後未確認)
+_icloud_backup_hash: bytes | None = None
+_icloud_backup_lock = threading.Lock()
+
+
+def _icloud_backup(kintai_data: dict, label: str = '', force: bool = False) -> dict:
     """kintai 勤怠データを iCloud Drive の :root/attendance/ にバックアップする。
 
     保存先:
       attendance/attendance_backup.json          ← 常に最新版 (既存 app.py と同フォーマット)
       attendance/Backup/attendance_backup_YYYYMMDD_HHMMSS.json ← 世代管理 (最大30件)
 
+    内容が前回のバックアップと同じなら書き込まない (force=True で常に書く)。
+    PWA の自動同期で同じ内容が繰り返し届いても、iCloud 転送と 30 世代枠を消費しない。
+
     Returns:
-      {'ok': bool, 'path': str, 'backup_path': str, 'error': str}
+      {'ok': bool, 'path': str, 'backup_path': str, 'error': str} (スキップ時は 'skipped': True)
     """
+    global _icloud_backup_hash
     ts = _dt.now().strftime('%Y%m%d_%H%M%S')
     result = {'ok': False, 'ts': ts}
     try:
-        ICLOUD_ATT_DIR.mkdir(parents=True, exist_ok=True)
-        ICLOUD_BACKUP_DIR.mkdir(parents=True, exist_ok=True)
-
         # メタ情報を除いたクリーンなデータを作成 (attendance_backup.json 互換フォーマット)
         clean = {k: v for k, v in kintai_data.items()
                  if k not in ('_server_saved_at', '_server_updated_at')}
 
-        content = json.dumps(clean, ensure_ascii=False, indent=2)
-
-        # ── メインバックアップ (attendance_backup.json) を上書き ──────────────
+        # 通常の勤怠データなら json.dumps(ensure_ascii=False, indent=2) と同等の整形 JSON (orjson があれば速く)。
+        # orjson では指数表記の浮動小数・NaN・64 bit を超える整数の扱いが違うので、app.py が書いた
+        # ファイルとのバイト単位の一致は前提にしない (一致しなくても起動後の初回に 1 回余分に書くだけ)
+        content = _json_dumps(clean, pretty=True)
+        digest = hashlib.blake2b(content, digest_size=16).digest()
         main_path = ICLOUD_ATT_DIR / 'attendance_backup.json'
-        main_path.write_text(content, encoding='utf-8')
-        print(f'☁️  iCloud backup → {main_path}')
-
-        # ── 世代バックアップ (Backup/YYYYMMDD_HHMMSS.json) ────────────────────
-        bak_name  = f'attendance_backup_{ts}.json'
-        bak_path  = ICLOUD_BACKUP_DIR / bak_name
-        bak_path.write_text(content, encoding='utf-8')
-        print(f'☁️  iCloud Backup  → {bak_path}')
 
-        # 古い世代を 30 件に制限
-        baks = sorted(ICLOUD_BACKUP_DIR.glob('attendance_backup_*.json'),
-                      key=lambda p: p.stat().st_mtime)
-        for old in baks[:-30]:
-            old.unlink(missing_ok=True)
+        with _icloud_backup_lock:
+            if _icloud_backup_hash is None:
+                # 起動後の初回だけ既存ファイルを読んで比較元にする
+                try:
+                    _icloud_backup_hash = hashlib.blake2b(main_path.read_bytes(), digest_size=16).digest()
+                except OSError:
+                    _icloud_backup_hash = b''
+            if not force and digest == _icloud_backup_hash:
+                result.update({'ok': True, 'skipped': True, 'main': str(main_path)})
+                return result
+
+            ICLOUD_ATT_DIR.mkdir(parents=True, exist_ok=True)
+            ICLOUD_BACKUP_DIR.mkdir(parents=True, exist_ok=True)
+
+            # ── メインバックアップ (attendance_backup.json) を上書き ──────────────
+            # 一時ファイルから置き換え、復元・一覧が書きかけのファイルを読まないようにする
+            tmp = main_path.with_name(f'.{main_path.name}.tmp')
+            tmp.write_bytes(content)
+            os.replace(tmp, main_path)
+            _icloud_backup_hash = digest
+            print(f'☁️  iCloud backup → {main_path}')
+
+            # ── 世代バックアップ (Backup/YYYYMMDD_HHMMSS.json) ────────────────────
+            bak_name  = f'attendance_backup_{ts}.json'
+            bak_path  = ICLOUD_BACKUP_DIR / bak_name
+            bak_path.write_bytes(content)
+            print(f'☁️  iCloud Backup  → {bak_path}')
+
+            # 古い世代を 30 件に制限
+            baks = sorted(ICLOUD_BACKUP_DIR.glob('attendance_backup_*.json'),
+                          key=lambda p: p.stat().st_mtime)
+            for old in baks[:-30]:
+                old.unlink(missing_ok=True)
 
         result.update({'ok': True, 'main': str(main_path), 'backup': str(bak_path)})
     except Exception as e:
@@ -266,18 +1349,255 @@ def _icloud_backup(kintai_data: dict, label: str = '') -> dict:
     return result
 
 
-class ReuseHTTPServer(ThreadingMixIn, HTTPServer):
-    """マルチスレッド + SO_REUSEADDR HTTPServer
-    ThreadingMixIn: 各リクエストを別スレッドで処理 → jinjer同期中もヘルスチェックが応答できる
+# 自動保存からの iCloud バックアップは一定時間まとめ、最後の内容だけ書く
+# (連続保存のたびに iCloud へのアップロードと世代ファイルを作らない)
+ICLOUD_BACKUP_DEBOUNCE = 10   # 秒
+_icloud_pending: dict | None = None
+_icloud_pending_timer: threading.Timer | None = None
+_icloud_pending_lock = threading.Lock()
+
+
+def _icloud_backup_later(kintai_data: dict) -> dict:
+    """kintai_data のバックアップを予約する。最初の予約から ICLOUD_BACKUP_DEBOUNCE 秒後に、
+    それまでに届いた最新の内容で _icloud_backup() を 1 回だけ行う。
+
+    Returns:
+      {'scheduled': True, 'delay': 秒}。まだ書いていないので 'ok' は含めない
+      (書き込みの成否は後でログに出るだけで、呼び出し側には返らない)
+    """
+    global _icloud_pending, _icloud_pending_timer
+    with _icloud_pending_lock:
+        _icloud_pending = kintai_data
+        if _icloud_pending_timer is None:
+            _icloud_pending_timer = threading.Timer(ICLOUD_BACKUP_DEBOUNCE, _flush_icloud_backup)
+            _icloud_pending_timer.daemon = True
+            _icloud_pending_timer.start()
+    return {'scheduled': True, 'delay': ICLOUD_BACKUP_DEBOUNCE}
+
+
+def _flush_icloud_backup():
+    """予約中のバックアップがあれば今すぐ書く (タイマー満了時・手動バックアップ前・終了時)"""
+    global _icloud_pending, _icloud_pending_timer
+    with _icloud_pending_lock:
+        data, _icloud_pending = _icloud_pending, None
+        if _icloud_pending_timer is not None:
+            _icloud_pending_timer.cancel()
+            _icloud_pending_timer = None
+    if data is not None:
+        _icloud_backup(data)
+
+
+def _discard_icloud_backup():
+    """予約中のバックアップを取り消す。予約された内容は保存済みのデータファイルにも入っているので、
+    直後にデータファイルから手動バックアップする場合は書く必要がない"""
+    global _icloud_pending, _icloud_pending_timer
+    with _icloud_pending_lock:
+        _icloud_pending = None
+        if _icloud_pending_timer is not None:
+            _icloud_pending_timer.cancel()
+            _icloud_pending_timer = None
+
+
+atexit.register(_flush_icloud_backup)
+
+
+class ReuseHTTPServer(ThreadingHTTPServer):
+    """固定ワーカープール + SO_REUSEADDR HTTPServer
+    接続ごとにスレッドを作らず、max_workers 本のワーカーが受付キューから処理する。
+    キューが max_backlog を超えた分は overflow_workers 本の別ワーカーに回し、/api/health と /api/ping
+    だけ 1 回応答して閉じ、それ以外は 503 を返す (jinjer 同期などでワーカーが埋まっていても
+    死活監視が落ちないようにする)。別ワーカーの待ちも max_backlog を超えたら即座に切る。
     """
     allow_reuse_address = True
     daemon_threads = True  # サーバー停止時にデーモンスレッドを強制終了
+    max_workers = max(1, int(os.environ.get('KINTAI_HTTP_THREADS', '16')))
+    max_backlog = max_workers * 4
+    overflow_workers = 2
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._requests: queue.Queue = queue.Queue()
+        self._overflow: queue.Queue = queue.Queue()
+        self._local = threading.local()
+        for i in range(self.max_workers):
+            threading.Thread(target=self._worker_loop, args=(self._requests, self.process_request_thread),
+                             name=f'http-worker-{i}', daemon=True).start()
+        for i in range(self.overflow_workers):
+            threading.Thread(target=self._worker_loop, args=(self._overflow, self._handle_overloaded),
+                             name=f'http-overflow-{i}', daemon=True).start()
+
+    def backlog(self) -> int:
+        """ワーカー待ちの接続数"""
+        return self._requests.qsize()
+
+    def keep_alive_ok(self) -> bool:
+        """今の接続を keep-alive してよいか。受付待ちがある / 過負荷用ワーカー上なら譲って閉じる"""
+        return not self.backlog() and not getattr(self._local, 'overflow', False)
+
+    def process_request(self, request, client_address):
+        if self._requests.qsize() < self.max_backlog:
+            self._requests.put((request, client_address))
+        elif self._overflow.qsize() < self.max_backlog:
+            self._overflow.put((request, client_address))
+        else:
+            self.shutdown_request(request)
+
+    @staticmethod
+    def _worker_loop(requests: queue.Queue, handle):
+        while True:
+            request, client_address = requests.get()
+            handle(request, client_address)
+
+    def _handle_overloaded(self, request, client_address):
+        """過負荷時: /api/health と /api/ping だけは処理し、それ以外は 503 で即座に閉じる"""
+        try:
+            request.settimeout(2)
+            head = request.recv(256, socket.MSG_PEEK)
+        except OSError:
+            head = b''
+        if head.split(b'\r\n', 1)[0].split(b' ')[1:2] in ([b'/api/health'], [b'/api/ping']):
+            # 1 リクエストだけ応答して閉じる (keep-alive で後続のリクエストまでここで抱えない)
+            self._local.overflow = True
+            try:
+                self.process_request_thread(request, client_address)
+            finally:
+                self._local.overflow = False
+            return
+        try:
+            request.sendall(b'HTTP/1.1 503 Service Unavailable\r\n'
+                            b'Content-Type: application/json; charset=utf-8\r\n'
+                            b'Retry-After: 2\r\nContent-Length: 25\r\nConnection: close\r\n\r\n'
+                            b'{"error":"server busy"}\r\n')
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+
+def _requires_reports(handler):
+    """report_sync.py (openpyxl) が読み込めないときは 500 を返すハンドラにする"""
+    def wrapped(self, *args):
+        if not _ensure_reports():
+            self._send_json({'error': 'report_sync.py が利用できません'}, 500)
+            return
+        return handler(self, *args)
+    return wrapped
+
+
+def _trusted_only(message: str):
+    """信頼できる送信元 (LAN / Tailscale / localhost) 以外には 403 を返すハンドラにする"""
+    def decorate(handler):
+        def wrapped(self, *args):
+            if not self._is_trusted_origin():
+                self._send_json({'error': message}, 403)
+                return
+            return handler(self, *args)
+        return wrapped
+    return decorate
+
+
+def _token_required(handler):
+    """X-Kintai-Token が一致しなければ 401 を返すハンドラにする (破壊的操作用)"""
+    def wrapped(self, *args):
+        if not self._check_api_token():
+            self._send_json({'error': '認証が必要です (X-Kintai-Token)'}, 401)
+            return
+        return handler(self, *args)
+    return wrapped
 
 
 class JinjerHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keep-alive: PWA の連続ポーリングで TCP 接続を使い回す。
+    # 全レスポンスが Content-Length を付けるのが前提。アイドル接続はワーカーを塞ぐので、
+    # 2 件目以降のリクエストは keepalive_timeout 秒だけ待って切る (リクエストの読み書き自体は timeout 秒)
+    protocol_version = 'HTTP/1.1'
+    timeout = 10
+    keepalive_timeout = 2
+    # keep-alive では write → write → read の順になるので Nagle + 遅延 ACK の待ちを避ける
+    disable_nagle_algorithm = True
+
     def log_message(self, fmt, *args):
         print(f'[jinjer_server] {fmt % args}')
 
+    def log_error(self, fmt, *args):
+        # keep-alive のアイドル切断は正常な終了なのでログに出さない
+        if self._idle and fmt.startswith('Request timed out'):
+            return
+        super().log_error(fmt, *args)
+
+    _idle = False
+
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            self._idle = True
+            self.connection.settimeout(self.keepalive_timeout)
+            self.handle_one_request()
+
+    def parse_request(self):
+        # リクエスト行が届いたら通常の timeout に戻す
+        if self._idle:
+            self._idle = False
+            self.connection.settimeout(self.timeout)
+        return super().parse_request()
+
+    def handle_one_request(self):
+        """1 リクエスト処理。応答しなかった / ボディを読み残した場合は接続を閉じる"""
+        self._responded = False
+        self._body_consumed = False
+        super().handle_one_request()
+        if not self._responded:
+            self.close_connection = True
+            return
+        headers = getattr(self, 'headers', None)
+        if headers is None or self._body_consumed or self.close_connection:
+            return
+        # 読まれなかったボディは次のリクエストと混ざるので読み捨てる (大きい / 長さ不明なら切断)
+        try:
+            length = -1 if headers.get('Transfer-Encoding') else int(headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if 0 < length <= 1024 * 1024:
+            self.rfile.read(length)
+        elif length != 0:
+            self.close_connection = True
+
+    def send_response(self, code, message=None):
+        self._responded = True
+        super().send_response(code, message)
+        # 接続はワーカーを占有するので、受付待ちがあれば keep-alive せずに譲る (Connection: close で
+        # close_connection も立つ)
+        keep_alive_ok = getattr(self.server, 'keep_alive_ok', None)
+        if not self.close_connection and keep_alive_ok is not None and not keep_alive_ok():
+            self.send_header('Connection', 'close')
+
+    # Server / Date ヘッダー: 定数と 1 秒単位キャッシュで毎レスポンスの strftime を省く
+    server_version = 'jinjer/1'
+    _date_cache: tuple[int, str] = (0, '')
+
+    def version_string(self):
+        return self.server_version
+
+    def date_time_string(self, timestamp=None):
+        if timestamp is not None:
+            return formatdate(timestamp, usegmt=True)
+        now = int(time.time())
+        sec, value = JinjerHandler._date_cache
+        if sec != now:
+            value = formatdate(now, usegmt=True)
+            JinjerHandler._date_cache = (now, value)
+        return value
+
+    _CORS_HEADERS = (
+        ('Access-Control-Allow-Origin', '*'),
+        ('Access-Control-Allow-Methods', 'GET, POST, OPTIONS'),
+        ('Access-Control-Allow-Headers', 'Content-Type'),
+    )
+
+    def _send_cors_headers(self):
+        for key, value in self._CORS_HEADERS:
+            self.send_header(key, value)
+
     # ─────────────────────────────────────────────────────────
     # セキュリティヘルパー
     # ─────────────────────────────────────────────────────────
@@ -335,17 +1655,158 @@ class JinjerHandler(BaseHTTPRequestHandler):
         import hmac
         return hmac.compare_digest(req_token, _API_TOKEN)
 
+    def _wants_pretty(self) -> bool:
+        """?pretty=1 が指定されていれば整形 JSON を返す (デバッグ用)"""
+        return parse_qs(urlparse(self.path).query).get('pretty', [''])[0] == '1'
+
+    _COMPRESS_MIN = 1024   # これ未満のボディは圧縮しない
+
+    def _accepted_encodings(self) -> set[str]:
+        """Accept-Encoding のうち q=0 でないものを返す"""
+        accepted = set()
+        for part in self.headers.get('Accept-Encoding', '').split(','):
+            token, _, params = part.partition(';')
+            token = token.strip().lower()
+            if token and params.replace(' ', '').lower() not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+                accepted.add(token)
+        return accepted
+
+    def _compression_for(self, size: int) -> str | None:
+        """size バイトのボディに使う Content-Encoding (圧縮しないなら None)"""
+        if size < self._COMPRESS_MIN:
+            return None
+        accepted = self._accepted_encodings()
+        if _BROTLI_OK and 'br' in accepted:
+            return 'br'
+        if 'gzip' in accepted:
+            return 'gzip'
+        return None
+
+    def _compress_body(self, body: bytes) -> tuple[bytes, str | None]:
+        """クライアントが対応していれば body を br / gzip で圧縮する。(body, Content-Encoding) を返す"""
+        encoding = self._compression_for(len(body))
+        if encoding == 'br':
+            return brotli.compress(body, quality=4), 'br'
+        if encoding == 'gzip':
+            return gzip.compress(body, compresslevel=1), 'gzip'
+        return body, None
+
     def _send_json(self, data, status=200):
-        body = json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+        self._send_json_raw(_json_dumps(data, pretty=self._wants_pretty()), status)
+
+    def _send_cached_json(self, entry: dict):
+        """_json_cache_entry() のエントリを返す。エンコード済み body をそのまま使い、
+        If-None-Match が ETag と一致すれば 304 (ボディなし) を返す。"""
+        if self._wants_pretty():
+            self._send_json(entry['data'])
+            return
+        etag = entry['etag']
+        headers = (('ETag', etag), ('Cache-Control', 'no-cache'))
+        if self._etag_matches(etag):
+            self.send_response(304)
+            for key, value in headers:
+                self.send_header(key, value)
+            self._send_cors_headers()
+            self.end_headers()
+            return
+        self._send_json_raw(entry['body'], extra_headers=headers)
+
+    def _etag_matches(self, etag: str) -> bool:
+        inm = self.headers.get('If-None-Match')
+        if not inm:
+            return False
+        bare = etag.removeprefix('W/')
+        return any(t == '*' or t.strip().removeprefix('W/') == bare for t in inm.split(','))
+
+    def _send_json_raw(self, body: bytes, status=200, extra_headers=()):
+        """エンコード済み JSON バイト列を送る"""
+        body, encoding = self._compress_body(body)
         self.send_response(status)
         self.send_header('Content-Type', 'application/json; charset=utf-8')
         self.send_header('Content-Length', str(len(body)))
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        for key, value in extra_headers:
+            self.send_header(key, value)
+        self._send_cors_headers()
+        self.send_header('X-Content-Type-Options', 'nosniff')
+        self._end_headers_with_body(body)
+
+    _WRITE_CHUNK = 64 * 1024
+
+    def _end_headers_with_body(self, body: bytes):
+        """ヘッダーを確定してボディを送る。小さいボディはヘッダーと連結して 1 回の write で送り、
+        大きいボディは sendmsg でヘッダーと並べて渡す（連結コピーなしで 1 回のシステムコール）。"""
+        if self.request_version == 'HTTP/0.9':
+            self.end_headers()
+            self._write_body(body)
+            return
+        self._headers_buffer.append(b'\r\n')
+        if len(body) <= self._WRITE_CHUNK:
+            self._headers_buffer.append(body)
+            self.flush_headers()
+            return
+        sendmsg = getattr(self.connection, 'sendmsg', None)
+        if sendmsg is None:
+            self.flush_headers()
+            self._write_body(body)
+            return
+        head = b''.join(self._headers_buffer)
+        self._headers_buffer = []
+        sent = sendmsg([head, body])
+        # 部分送信時は残りを sendall で送り切る
+        if sent < len(head):
+            self.connection.sendall(memoryview(head)[sent:])
+            sent = len(head)
+        if sent - len(head) < len(body):
+            self.connection.sendall(memoryview(body)[sent - len(head):])
+
+    def _sendfile_json(self, f, size: int, prefix: bytes, suffix: bytes):
+        """prefix + ファイル f の先頭 size バイト + suffix を非圧縮の JSON として送る。
+        prefix はヘッダーと同じ write に載せ、ファイル部分は sendfile でユーザー空間を通さずに送る。"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(prefix) + size + len(suffix)))
+        self.send_header('Vary', 'Accept-Encoding')
+        self._send_cors_headers()
+        self.send_header('X-Content-Type-Options', 'nosniff')
+        if self.request_version == 'HTTP/0.9':
+            self.wfile.write(prefix)
+        else:
+            self._headers_buffer.append(b'\r\n' + prefix)
+            self.flush_headers()
+        self.connection.sendfile(f, 0, size)
+        self.connection.sendall(suffix)
+
+    _STREAM_FLUSH = 16 * 1024   # ストリーム応答はこの程度まとめてから書き出す
+
+    def _start_stream(self, content_type: str) -> bool:
+        """長さ未定のボディを流すヘッダーを送る。HTTP/1.1 なら chunked (True)、それ以外は送信後に切断"""
+        chunked = self.request_version == 'HTTP/1.1'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Cache-Control', 'no-cache')
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self._send_cors_headers()
         self.send_header('X-Content-Type-Options', 'nosniff')
         self.end_headers()
-        self.wfile.write(body)
+        return chunked
+
+    def _write_stream(self, data: bytes, chunked: bool):
+        """_start_stream() 後のボディを書く。chunked では空の data が終端チャンクになる"""
+        if chunked:
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        elif data:
+            self.wfile.write(data)
+
+    def _write_body(self, body: bytes):
+        """レスポンスボディを書き込む。memoryview で渡してスライスのコピーを避ける。"""
+        self.wfile.write(memoryview(body) if len(body) > self._WRITE_CHUNK else body)
 
     def _send_text(self, text: str, status=200):
         body = text.encode('utf-8')
@@ -354,340 +1815,272 @@ class JinjerHandler(BaseHTTPRequestHandler):
         self.send_header('Content-Length', str(len(body)))
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('X-Content-Type-Options', 'nosniff')
-        self.end_headers()
-        self.wfile.write(body)
+        self._end_headers_with_body(body)
+
+    def _send_text_file(self, path: Path, status=200):
+        """テキストファイルを送る。ETag 一致なら 304、gzip 可なら mtime 単位でキャッシュした圧縮済み
+        バイト列、それ以外は sendfile でそのまま送る (str / bytes への読み込みを行わない)。"""
+        with open(path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            size = st.st_size
+            etag = f'W/"{size:x}-{st.st_mtime_ns:x}"'
+            headers = (
+                ('ETag', etag),
+                ('Last-Modified', formatdate(st.st_mtime, usegmt=True)),
+                ('Cache-Control', 'no-cache'),
+                ('Vary', 'Accept-Encoding'),
+                ('Access-Control-Allow-Origin', '*'),
+                ('X-Content-Type-Options', 'nosniff'),
+            )
+            if status == 200 and self._etag_matches(etag):
+                self.send_response(304)
+                for key, value in headers:
+                    self.send_header(key, value)
+                self.end_headers()
+                return
+            gz = None
+            if size >= self._COMPRESS_MIN and 'gzip' in self._accepted_encodings():
+                gz = _gzip_file_cached(path, f, st)
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/plain; charset=utf-8')
+            if gz is not None:
+                self.send_header('Content-Length', str(len(gz)))
+                self.send_header('Content-Encoding', 'gzip')
+            else:
+                self.send_header('Content-Length', str(size))
+            for key, value in headers:
+                self.send_header(key, value)
+            if gz is not None:
+                self._end_headers_with_body(gz)
+                return
+            self.end_headers()
+            self.wfile.flush()
+            self.connection.sendfile(f, 0, size)
 
     def _read_body(self) -> dict:
-        """POST ボディを JSON として読み込む"""
+        """POST ボディを JSON として読み込む (orjson があればそちらでパース)。
+
+        空・壊れた JSON は {} を返す。トップレベルが配列や数値の JSON はそのまま返すので、
+        オブジェクトを期待する呼び出し側は isinstance(data, dict) を確認すること。
+        値の型も検証しないので、文字列項目は _body_str() で取り出す。
+        """
+        self._body_consumed = True
         length = int(self.headers.get('Content-Length', 0))
         if length == 0:
             return {}
         raw = self.rfile.read(length)
         try:
-            return json.loads(raw.decode('utf-8'))
+            return _json_loads(raw)
         except Exception:
             return {}
 
     def do_OPTIONS(self):
         self.send_response(204)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
-
-    def do_GET(self):
-        parsed = urlparse(self.path)
-        path   = parsed.path
-        params = parse_qs(parsed.query)
-
-        # ===== /api/health =====
-        if path == '/api/health':
-            # Docker デーモン稼働チェック（タイムアウト2秒）
-            try:
-                dr, dout, _ = self._run_docker(
-                    ['info', '--format', '{{.ContainersRunning}}/{{.Containers}}'], timeout=2)
-                docker_info = dout.strip() if dr == 0 else None
-            except Exception:
-                docker_info = None
-            self._send_json({
-                'status':          'ok',
-                'uptime_seconds':  int(time.time() - _START_TIME),
-                'report':          _REPORT_OK,
-                'scraper':         _SCRAPER_OK,
-                'docker':          docker_info,   # "3/7" or null
-                'tunnel':          bool(_CF_TUNNEL_URL),
-            })
-
-        # ===== /api/jinjer =====
-        elif path == '/api/jinjer':
-            self._handle_jinjer(params)
-
-        # ===== /api/reports =====
-        elif path == '/api/reports':
-            if not _REPORT_OK:
-                self._send_json({'error': 'report_sync.py が利用できません'}, 500)
-                return
-            self._send_json(list_reports())
-
-        # ===== /api/reports/read =====
-        elif path == '/api/reports/read':
-            if not _REPORT_OK:
-                self._send_json({'error': 'report_sync.py が利用できません'}, 500)
-                return
-            year  = params.get('year',  [''])[0]
-            month = params.get('month', [''])[0]
-            if not year or not month:
-                self._send_json({'error': 'year と month パラメータが必要です'}, 400)
-                return
-            data = read_report(year, month)
-            if data is None:
-                self._send_json({'error': f'{year}年{month}月の Excel が見つかりません'}, 404)
-                return
-            self._send_json(data)
-
-        # ===== /api/structure =====
-        elif path == '/api/structure':
-            if STRUCTURE_MD.exists():
-                self._send_text(STRUCTURE_MD.read_text(encoding='utf-8'))
-            else:
-                self._send_text('STRUCTURE.md が生成されていません。generate_structure.py を実行してください。', 404)
-
-        # ===== /api/prompts =====
-        elif path == '/api/prompts':
-            result = []
-            if PROMPTS_DIR.exists():
-                import glob as _glob
-                for md_path in sorted(_glob.glob(str(PROMPTS_DIR / '*.md'))):
-                    try:
-                        text = Path(md_path).read_text(encoding='utf-8').strip()
-                        lines = text.splitlines()
-                        category = lines[0].lstrip('# ').strip() if lines else Path(md_path).stem
-                        items = []
-                        for line in lines[1:]:
-                            line = line.strip()
-                            if line.startswith('- ') and line[2:]:
-                                prompt_text = line[2:].strip()
-                                # アイコン検出 (行頭の絵文字)
-                                import unicodedata as _ud
-                                icon = '💬'
-                                for ch in prompt_text:
-                                    if _ud.category(ch) in ('So', 'Sm') or ord(ch) > 0x1F300:
-                                        icon = ch
-                                        break
-                                items.append({'icon': icon, 'text': prompt_text})
-                        if items:
-                            result.append({'category': category, 'items': items})
-                    except Exception:
-                        pass
-            if result:
-                self._send_json(result)
-            else:
-                self._send_json([], 204)
-
-        # ===== /api/jobs =====
-        elif path == '/api/jobs':
-            self._handle_jobs(params)
-
-        # ===== /api/files =====
-        elif path == '/api/files':
-            self._handle_files_list()
-
-        # ===== /api/files/read =====
-        elif path == '/api/files/read':
-            self._handle_files_read(params)
-
-        # ===== /api/system/logs =====
-        elif path == '/api/system/logs':
-            self._handle_system_logs(params)
-
-        # ===== /api/system/logs/dates — 利用可能な日付アーカイブ一覧 =====
-        elif path == '/api/system/logs/dates':
-            self._handle_log_dates()
-
-        # ===== /api/kintai-data — カレンダーデータ取得 =====
-        elif path == '/api/kintai-data':
-            self._handle_data_get(KINTAI_DATA_FILE)
-
-        # ===== /api/tasks-data — タスクデータ取得 =====
-        elif path == '/api/tasks-data':
-            self._handle_data_get(TASKS_DATA_FILE)
-
-        # ===== /api/tailscale-url — Tailscale Serve の HTTPS URL を返す =====
-        elif path == '/api/tailscale-url':
-            self._handle_tailscale_url()
-
-        # ===== /api/tunnel-url — Cloudflare Quick Tunnel の現在 URL を返す =====
-        elif path == '/api/tunnel-url':
-            self._handle_tunnel_url()
-
-        # ===== /api/server-info — LAN IP + Tunnel URL + ポート情報をまとめて返す =====
-        elif path == '/api/server-info':
-            self._handle_server_info()
-
-        # ===== /api/docker/containers — コンテナ一覧 =====
-        elif path == '/api/docker/containers':
-            self._handle_docker_containers()
-
-        # ===== /api/docker/images — イメージ一覧 =====
-        elif path == '/api/docker/images':
-            self._handle_docker_images()
-
-        # ===== /api/docker/logs — コンテナログ =====
-        elif path == '/api/docker/logs':
-            self._handle_docker_logs(params)
-
-        # ===== /api/docker/stats — 実行中コンテナのリソース使用量 =====
-        elif path == '/api/docker/stats':
-            self._handle_docker_stats()
-
-        # ===== /api/miniserve-url — miniserve の LAN URL を返す =====
-        elif path == '/api/miniserve-url':
-            self._handle_miniserve_url()
-
-        # ===== /api/ttyd-url — ttyd ブラウザ端末の URL を返す =====
-        elif path == '/api/ttyd-url':
-            self._handle_ttyd_url()
+        self._send_cors_headers()
+        self.end_headers()
 
-        # ===== /api/backup/full — フルバックアップ取得 =====
-        elif path == '/api/backup/full':
-            self._handle_full_backup_get()
+    # ===== ルーティング =====
+    # パス → ハンドラの表。elif の連鎖を上から比較せず 1 回の dict 参照で振り分ける。
+    # ハンドラは GET が (self, params)、POST が (self)。アクセス制限はデコレータで表に組み込む
+    _GET_ROUTES = {
+        '/api/health':            lambda self, params: self._send_json_raw(_health_body(self._health_docker_info())),
+        '/api/ping':              lambda self, params: self._send_json_raw(b'{"ok":true}'),
+        '/api/jinjer':            lambda self, params: self._handle_jinjer(params),
+        '/api/reports':           lambda self, params: self._handle_reports_list(),
+        '/api/reports/read':      lambda self, params: self._handle_reports_read(params),
+        '/api/structure':         lambda self, params: self._handle_structure(),
+        '/api/prompts':           lambda self, params: self._handle_prompts(),
+        '/api/jobs':              lambda self, params: self._handle_jobs(params),
+        '/api/files':             lambda self, params: self._handle_files_list(),
+        '/api/files/read':        lambda self, params: self._handle_files_read(params),
+        '/api/system/logs':       lambda self, params: self._handle_system_logs(params),
+        # 利用可能な日付アーカイブ一覧
+        '/api/system/logs/dates': lambda self, params: self._handle_log_dates(),
+        # カレンダー / タスクデータ取得
+        '/api/kintai-data':       lambda self, params: self._handle_data_get(KINTAI_DATA_FILE),
+        '/api/tasks-data':        lambda self, params: self._handle_data_get(TASKS_DATA_FILE),
+        # Tailscale Serve の HTTPS URL / Cloudflare Quick Tunnel の現在 URL
+        '/api/tailscale-url':     lambda self, params: self._handle_tailscale_url(),
+        '/api/tunnel-url':        lambda self, params: self._handle_tunnel_url(),
+        # LAN IP + Tunnel URL + ポート情報をまとめて返す
+        '/api/server-info':       lambda self, params: self._handle_server_info(),
+        '/api/docker/containers': lambda self, params: self._handle_docker_containers(),
+        '/api/docker/images':     lambda self, params: self._handle_docker_images(),
+        '/api/docker/logs':       lambda self, params: self._handle_docker_logs(params),
+        # 実行中コンテナのリソース使用量
+        '/api/docker/stats':      lambda self, params: self._handle_docker_stats(),
+        # miniserve の LAN URL / ttyd ブラウザ端末の URL
+        '/api/miniserve-url':     lambda self, params: self._handle_miniserve_url(),
+        '/api/ttyd-url':          lambda self, params: self._handle_ttyd_url(),
+        # フルバックアップ取得 / iCloud バックアップ一覧 / バックアップ内容取得
+        '/api/backup/full':       lambda self, params: self._handle_full_backup_get(),
+        '/api/backup/list':       lambda self, params: self._handle_backup_list(),
+        '/api/backup/read':       lambda self, params: self._handle_backup_read(params),
+        '/api/obsidian/config':   lambda self, params: self._handle_obsidian_config_get(),
+        '/api/obsidian/list':     lambda self, params: self._handle_obsidian_list(params),
+        '/api/obsidian/read':     lambda self, params: self._handle_obsidian_read(params),
+    }
 
-        # ===== /api/backup/list — iCloud バックアップ一覧 =====
-        elif path == '/api/backup/list':
-            self._handle_backup_list()
+    _POST_ROUTES = {
+        # カレンダー / タスクデータ保存
+        '/api/kintai-data':       _trusted_only('外部からのデータ書き込みは不可')(
+                                      lambda self: self._handle_data_post(KINTAI_DATA_FILE)),
+        '/api/tasks-data':        _trusted_only('外部からのデータ書き込みは不可')(
+                                      lambda self: self._handle_data_post(TASKS_DATA_FILE)),
+        # フルバックアップ保存
+        '/api/backup/full':       _trusted_only('外部からのバックアップ書き込みは不可')(
+                                      lambda self: self._handle_full_backup_post()),
+        '/api/reports/sync':      lambda self: self._handle_reports_sync(),
+        '/api/reports/generate':  lambda self: self._handle_reports_generate(),
+        # コンテナ操作 (start/stop/restart/rm) / イメージプル / コンテナ作成・起動
+        '/api/docker/action':     lambda self: self._handle_docker_action(),
+        '/api/docker/pull':       lambda self: self._handle_docker_pull(),
+        '/api/docker/run':        lambda self: self._handle_docker_run(),
+        '/api/system/restart':    _token_required(lambda self: self._handle_system_restart()),
+        # 手動 iCloud バックアップ実行 / バックアップから kintai データを復元
+        '/api/backup/now':        _token_required(lambda self: self._handle_backup_now()),
+        '/api/backup/restore':    _token_required(lambda self: self._handle_backup_restore()),
+        # 勤怠メモをサーバーログに保存
+        '/api/memo-log':          lambda self: self._handle_memo_log(),
+        # SSH 公開鍵を authorized_keys に追加
+        '/api/ssh/add-pubkey':    lambda self: self._handle_ssh_add_pubkey(),
+        '/api/obsidian/config':   _trusted_only('外部からのアクセスは不可')(
+                                      lambda self: self._handle_obsidian_config_post()),
+        '/api/obsidian/write':    _trusted_only('外部からのアクセスは不可')(
+                                      lambda self: self._handle_obsidian_write()),
+        '/api/obsidian/delete':   _trusted_only('外部からのアクセスは不可')(
+                                      lambda self: self._handle_obsidian_delete()),
+        '/api/obsidian/mkdir':    _trusted_only('外部からのアクセスは不可')(
+                                      lambda self: self._handle_obsidian_mkdir()),
+        '/api/obsidian/sync-backup': _trusted_only('外部からのアクセスは不可')(
+                                      lambda self: self._handle_obsidian_sync_backup()),
+    }
 
-        # ===== /api/backup/read — バックアップ内容取得 =====
-        elif path == '/api/backup/read':
-            self._handle_backup_read(params)
+    # ===== 静的ファイル配信 — http://localhost:8899/ で PWA を直接表示 =====
+    # Safari は HTTPS(GitHub Pages) → HTTP(localhost) の混在コンテンツをブロックするため、
+    # Mac では http://localhost:8899/ を直接開くことで同一オリジンになりブロックを回避できる。
+    _STATIC_ROUTES = {
+        '/': 'index.html', '/index.html': 'index.html',
+        '/sw.js': 'sw.js', '/manifest.json': 'manifest.json', '/recover.html': 'recover.html',
+        '/icon-apple.png': 'icon-apple.png', '/icon-192.png': 'icon-192.png', '/icon-512.png': 'icon-512.png',
+    }
+    # SNS Collector UI を 8899 経由で提供 (iPhone 対応)。
+    # iPhone は localhost:8900 に直接アクセスできないため、8899 経由で提供する。
+    # SNS Collector の index.html は origin のポートで API URL を自動判定する。
+    _SNS_UI_PATHS = frozenset({'/sns-collector', '/sns-collector/', '/sns-collector/index.html'})
 
-        elif path == '/api/obsidian/config':
-            self._handle_obsidian_config_get()
-        elif path == '/api/obsidian/list':
-            self._handle_obsidian_list(params)
-        elif path == '/api/obsidian/read':
-            self._handle_obsidian_read(params)
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        path   = parsed.path
 
+        handler = self._GET_ROUTES.get(path)
+        if handler is not None:
+            handler(self, parse_qs(parsed.query))
         # ===== /api/sns/* — SNS Collector (port 8900) へのプロキシ =====
         elif path.startswith('/api/sns/'):
             self._handle_sns_proxy(path, parsed.query, method='GET')
-
-        # ===== /sns-collector — SNS Collector UI を 8899 経由で提供 (iPhone 対応) =====
-        # iPhone は localhost:8900 に直接アクセスできないため、8899 経由で提供する。
-        # SNS Collector の index.html は origin のポートで API URL を自動判定する。
-        elif path in ('/sns-collector', '/sns-collector/') or path == '/sns-collector/index.html':
+        elif path in self._SNS_UI_PATHS:
             self._send_static_abs(str(Path(__file__).parent.parent / 'sns-collector' / 'index.html'))
-
-        # ===== 静的ファイル配信 — http://localhost:8899/ で PWA を直接表示 =====
-        # Safari は HTTPS(GitHub Pages) → HTTP(localhost) の混在コンテンツをブロックするため、
-        # Mac では http://localhost:8899/ を直接開くことで同一オリジンになりブロックを回避できる。
-        elif path in ('/', '/index.html'):
-            self._send_static('index.html')
-        elif path in ('/sw.js', '/manifest.json', '/recover.html',
-                      '/icon-apple.png', '/icon-192.png', '/icon-512.png'):
-            self._send_static(path)
-
+        elif path in self._STATIC_ROUTES:
+            self._send_static(self._STATIC_ROUTES[path])
         else:
             self._send_json({'error': 'Not found'}, 404)
 
     def do_POST(self):
-        parsed = urlparse(self.path)
-        path   = parsed.path
-
-        # ===== /api/kintai-data — カレンダーデータ保存 =====
-        if path == '/api/kintai-data':
-            if not self._is_trusted_origin():
-                self._send_json({'error': '外部からのデータ書き込みは不可'}, 403); return
-            self._handle_data_post(KINTAI_DATA_FILE)
-
-        # ===== /api/tasks-data — タスクデータ保存 =====
-        elif path == '/api/tasks-data':
-            if not self._is_trusted_origin():
-                self._send_json({'error': '外部からのデータ書き込みは不可'}, 403); return
-            self._handle_data_post(TASKS_DATA_FILE)
-
-        # ===== /api/backup/full — フルバックアップ保存 =====
-        elif path == '/api/backup/full':
-            if not self._is_trusted_origin():
-                self._send_json({'error': '外部からのバックアップ書き込みは不可'}, 403); return
-            self._handle_full_backup_post()
-
-        # ===== /api/reports/sync =====
-        elif path == '/api/reports/sync':
-            if not _REPORT_OK:
-                self._send_json({'error': 'report_sync.py が利用できません'}, 500)
-                return
-            body  = self._read_body()
-            year  = str(body.get('year', ''))
-            month = str(body.get('month', ''))
-            kdata = body.get('kintai_data', {})
-            if not year or not month or not kdata:
-                self._send_json({'error': 'year, month, kintai_data が必要です'}, 400)
-                return
-            month = month.zfill(2)
-            result = write_report_from_kintai(year, month, kdata)
-            self._send_json(result, 200 if result['ok'] else 500)
-
-        # ===== /api/reports/generate =====
-        elif path == '/api/reports/generate':
-            if not _REPORT_OK:
-                self._send_json({'error': 'report_sync.py が利用できません'}, 500)
-                return
-            body  = self._read_body()
-            year  = str(body.get('year', ''))
-            month = str(body.get('month', ''))
-            if not year or not month:
-                self._send_json({'error': 'year と month が必要です'}, 400)
-                return
-            month = month.zfill(2)
-            result = create_next_month_report(year, month)
-            self._send_json(result, 200 if result['ok'] else 400)
-
-        # ===== /api/docker/action — コンテナ操作 (start/stop/restart/rm) =====
-        elif path == '/api/docker/action':
-            self._handle_docker_action()
-
-        # ===== /api/docker/pull — イメージプル =====
-        elif path == '/api/docker/pull':
-            self._handle_docker_pull()
-
-        # ===== /api/docker/run — コンテナ作成・起動 =====
-        elif path == '/api/docker/run':
-            self._handle_docker_run()
-
-        # ===== /api/system/restart =====
-        elif path == '/api/system/restart':
-            if not self._check_api_token():
-                self._send_json({'error': '認証が必要です (X-Kintai-Token)'}, 401); return
-            self._handle_system_restart()
-
-        # ===== /api/backup/now — 手動 iCloud バックアップ実行 =====
-        elif path == '/api/backup/now':
-            if not self._check_api_token():
-                self._send_json({'error': '認証が必要です (X-Kintai-Token)'}, 401); return
-            self._handle_backup_now()
-
-        # ===== /api/backup/restore — バックアップから kintai データを復元 =====
-        elif path == '/api/backup/restore':
-            if not self._check_api_token():
-                self._send_json({'error': '認証が必要です (X-Kintai-Token)'}, 401); return
-            self._handle_backup_restore()
-
-        # ===== /api/memo-log — 勤怠メモをサーバーログに保存 =====
-        elif path == '/api/memo-log':
-            self._handle_memo_log()
-
-        # ===== /api/ssh/add-pubkey — SSH 公開鍵を authorized_keys に追加 =====
-        elif path == '/api/ssh/add-pubkey':
-            self._handle_ssh_add_pubkey()
-
-        elif path == '/api/obsidian/config':
-            if not self._is_trusted_origin():
-                self._send_json({'error': '外部からのアクセスは不可'}, 403); return
-            self._handle_obsidian_config_post()
-        elif path == '/api/obsidian/write':
-            if not self._is_trusted_origin():
-                self._send_json({'error': '外部からのアクセスは不可'}, 403); return
-            self._handle_obsidian_write()
-        elif path == '/api/obsidian/delete':
-            if not self._is_trusted_origin():
-                self._send_json({'error': '外部からのアクセスは不可'}, 403); return
-            self._handle_obsidian_delete()
-        elif path == '/api/obsidian/mkdir':
-            if not self._is_trusted_origin():
-                self._send_json({'error': '外部からのアクセスは不可'}, 403); return
-            self._handle_obsidian_mkdir()
-        elif path == '/api/obsidian/sync-backup':
-            if not self._is_trusted_origin():
-                self._send_json({'error': '外部からのアクセスは不可'}, 403); return
-            self._handle_obsidian_sync_backup()
+        path = urlparse(self.path).path
 
+        handler = self._POST_ROUTES.get(path)
+        if handler is not None:
+            handler(self)
         # ===== /api/sns/* — SNS Collector (port 8900) へのプロキシ =====
         elif path.startswith('/api/sns/'):
             self._handle_sns_proxy(path, '', method='POST')
-
         else:
             self._send_json({'error': 'Not found'}, 404)
 
+    # ===== 帳票 (report_sync) =====
+    @_requires_reports
+    def _handle_reports_list(self):
+        self._send_json(list_reports())
+
+    @_requires_reports
+    def _handle_reports_read(self, params: dict):
+        year  = params.get('year',  [''])[0]
+        month = params.get('month', [''])[0]
+        if not year or not month:
+            self._send_json({'error': 'year と month パラメータが必要です'}, 400)
+            return
+        data = read_report(year, month)
+        if data is None:
+            self._send_json({'error': f'{year}年{month}月の Excel が見つかりません'}, 404)
+            return
+        self._send_json(data)
+
+    @_requires_reports
+    def _handle_reports_sync(self):
+        body  = self._read_body()
+        year  = str(body.get('year', ''))
+        month = str(body.get('month', ''))
+        kdata = body.get('kintai_data', {})
+        if not year or not month or not kdata:
+            self._send_json({'error': 'year, month, kintai_data が必要です'}, 400)
+            return
+        month = month.zfill(2)
+        result = write_report_from_kintai(year, month, kdata)
+        self._send_json(result, 200 if result['ok'] else 500)
+
+    @_requires_reports
+    def _handle_reports_generate(self):
+        body  = self._read_body()
+        year  = str(body.get('year', ''))
+        month = str(body.get('month', ''))
+        if not year or not month:
+            self._send_json({'error': 'year と month が必要です'}, 400)
+            return
+        month = month.zfill(2)
+        result = create_next_month_report(year, month)
+        self._send_json(result, 200 if result['ok'] else 400)
+
+    def _handle_structure(self):
+        try:
+            self._send_text_file(STRUCTURE_MD)
+        except FileNotFoundError:
+            self._send_text('STRUCTURE.md が生成されていません。generate_structure.py を実行してください。', 404)
+
+    def _handle_prompts(self):
+        result = []
+        if PROMPTS_DIR.exists():
+            import glob as _glob
+            for md_path in sorted(_glob.glob(str(PROMPTS_DIR / '*.md'))):
+                try:
+                    text = Path(md_path).read_text(encoding='utf-8').strip()
+                    lines = text.splitlines()
+                    category = lines[0].lstrip('# ').strip() if lines else Path(md_path).stem
+                    items = []
+                    for line in lines[1:]:
+                        line = line.strip()
+                        if line.startswith('- ') and line[2:]:
+                            prompt_text = line[2:].strip()
+                            # アイコン検出 (行頭の絵文字)
+                            import unicodedata as _ud
+                            icon = '💬'
+                            for ch in prompt_text:
+                                if _ud.category(ch) in ('So', 'Sm') or ord(ch) > 0x1F300:
+                                    icon = ch
+                                    break
+                            items.append({'icon': icon, 'text': prompt_text})
+                    if items:
+                        result.append({'category': category, 'items': items})
+                except Exception:
+                    pass
+        if result:
+            self._send_json(result)
+        else:
+            # 204 はボディを持てない (keep-alive で次の応答に混ざる) ので、ヘッダーだけ返す
+            self.send_response(204)
+            self._send_cors_headers()
+            self.end_headers()
+
     # ===== 内部: フリーランス案件フィード =====
     def _handle_jobs(self, params: dict):
         platforms_str  = params.get('platforms',  ['crowdworks,lancers'])[0]
@@ -697,41 +2090,50 @@ class JinjerHandler(BaseHTTPRequestHandler):
         platforms  = [p.strip() for p in platforms_str.split(',')  if p.strip()]
         cat_ids    = [c.strip() for c in categories_str.split(',') if c.strip()]
         keywords   = [k.strip().lower() for k in keywords_str.split(',') if k.strip()]
+        # ?fields=title,url,budget,match_score で必要な項目だけ返す (省略時は全項目)
+        fields     = tuple(dict.fromkeys(f.strip() for f in params.get('fields', [''])[0].split(',') if f.strip()))
 
         cache_key = f"{','.join(sorted(platforms))}|{','.join(sorted(cat_ids))}|{keywords_str}"
-        if cache_key in _jobs_cache and time.time() - _jobs_cache[cache_key]['ts'] < JOBS_CACHE_TTL:
-            print(f'[jobs cache hit] {cache_key}')
-            self._send_json(_jobs_cache[cache_key]['data'])
+        # jinjer と同じく、同じ条件のフィード取得が進行中ならその結果を待つ。
+        # 期限切れ直後 (猶予期間内) なら古い結果を返し、取り直しは裏で 1 本だけ走らせる
+        owner = refresh = False
+        with _jobs_lock:
+            cached, fresh = _jobs_cache.get_stale(cache_key)
+            fut = _jobs_inflight.get(cache_key)
+            if fut is None and (cached is None or not fresh):
+                fut = _jobs_inflight[cache_key] = Future()
+                owner, refresh = cached is None, cached is not None
+        if cached is not None:
+            print(f'[jobs cache {"hit" if fresh else "stale"}] {cache_key}')
+            self._send_cached_json(_jobs_view(cached, fields))
+            if refresh:
+                _refresh_in_background(_refresh_jobs, cache_key, platforms, cat_ids, keywords, fut)
+            return
+        if not owner:
+            print(f'[jobs wait] {cache_key}')
+            self._send_inflight_result(fut, lambda e: _jobs_view(e, fields))
             return
 
-        all_jobs: list = []
-        if 'crowdworks' in platforms:
-            for cat in cat_ids:
-                all_jobs.extend(_fetch_cw_feed(cat))
-        if 'lancers' in platforms:
-            for wtype in ['system', 'web', 'app']:
-                all_jobs.extend(_fetch_lancers_feed(wtype))
-
-        # キーワードマッチスコアを計算してフィルタリング
-        if keywords:
-            for job in all_jobs:
-                text = (job['title'] + ' ' + job['summary']).lower()
-                job['match_score'] = sum(1 for kw in keywords if kw in text)
-            all_jobs.sort(key=lambda j: (-j['match_score'], j.get('updated', '')))
-        else:
-            all_jobs.sort(key=lambda j: j.get('updated', ''), reverse=True)
+        try:
+            entry = _refresh_jobs(cache_key, platforms, cat_ids, keywords, fut)
+        except Exception as e:
+            self._send_json({'error': str(e)}, 500)
+            return
+        self._send_cached_json(_jobs_view(entry, fields))
 
-        result = {
-            'jobs':       all_jobs,
-            'total':      len(all_jobs),
-            'fetched_at': _dt.now().isoformat(),
-        }
-        _jobs_cache[cache_key] = {'ts': time.time(), 'data': result}
-        self._send_json(result)
+    def _send_inflight_result(self, fut: Future, view=None):
+        """他スレッドが実行中の処理 (single-flight) の結果を待って返す (view があれば結果を変換してから)"""
+        try:
+            entry = fut.result(timeout=INFLIGHT_WAIT_TIMEOUT)
+            self._send_cached_json(view(entry) if view else entry)
+        except TimeoutError:
+            self._send_json({'error': '処理がタイムアウトしました。しばらくしてから再試行してください。'}, 504)
+        except Exception as e:
+            self._send_json({'error': str(e)}, 500)
 
     # ===== 内部: jinjer 同期 =====
     def _handle_jinjer(self, params: dict):
-        if not _SCRAPER_OK:
+        if not _ensure_scraper():
             self._send_json({'error': 'sync_jinjer.py のインポートに失敗しています'}, 500)
             return
 
@@ -743,55 +2145,81 @@ class JinjerHandler(BaseHTTPRequestHandler):
         target_months = [m.strip() for m in months_str.split(',') if m.strip()]
         cache_key = ','.join(sorted(target_months))
 
-        if cache_key in _cache and time.time() - _cache[cache_key]['ts'] < CACHE_TTL:
-            print(f'[cache hit] {cache_key}')
-            self._send_json(_cache[cache_key]['data'])
+        # キャッシュ確認。同じ cache_key を別スレッドがスクレイプ中ならその結果を共有する。
+        # 期限切れ直後 (猶予期間内) なら古い結果を返し、スクレイプは裏で 1 本だけ走らせる
+        owner = refresh = False
+        with _cache_lock:
+            cached, fresh = _cache.get_stale(cache_key)
+            fut = _inflight.get(cache_key)
+            if fut is None and (cached is None or not fresh):
+                fut = _inflight[cache_key] = Future()
+                owner, refresh = cached is None, cached is not None
+        if cached is not None:
+            print(f'[cache {"hit" if fresh else "stale"}] {cache_key}')
+            self._send_cached_json(cached)
+            if refresh:
+                _refresh_in_background(_refresh_jinjer, cache_key, target_months, fut)
+            return
+        if not owner:
+            print(f'[scrape wait] {cache_key}')
+            self._send_inflight_result(fut)
             return
 
-        print(f'[scrape] {target_months}')
         try:
-            all_rows = asyncio.run(scrape_months(target_months))
-            pwa_data = convert_all(all_rows)
-            _cache[cache_key] = {'ts': time.time(), 'data': pwa_data}
-            # iCloud + ローカル保存（改善版関数を使用）
-            try:
-                save_to_icloud_and_local(target_months, pwa_data)
-            except Exception as save_e:
-                print(f'[WARN] iCloud保存失敗: {save_e}')
-            self._send_json(pwa_data)
+            entry = _refresh_jinjer(cache_key, target_months, fut)
         except Exception as e:
             print(f'[ERROR] スクレイプ失敗: {e}')
             import traceback; traceback.print_exc()
             self._send_json({'error': str(e)}, 500)
+            return
+        self._send_cached_json(entry)
 
     # ===== ファイル一覧 =====
+    # /api/files の除外ルール (リクエストごとに作らない)
+    _FILES_EXCLUDE_NAMES = frozenset({'.git', '__pycache__', 'node_modules', '.DS_Store'})
+    _FILES_EXCLUDE_EXTS  = frozenset({'.pyc', '.pyo'})
+    _FILES_DOT_DESCEND   = frozenset({'.env', '.gitignore'})   # 配下も列挙する隠しディレクトリ
+
     def _handle_files_list(self):
-        _EXCLUDE_DIRS  = {'.git', '__pycache__', 'node_modules', '.DS_Store'}
-        _EXCLUDE_EXTS  = {'.pyc', '.pyo'}
-        root = _HERE.resolve()
+        exclude_names = self._FILES_EXCLUDE_NAMES
+        exclude_exts  = self._FILES_EXCLUDE_EXTS
+        dot_descend   = self._FILES_DOT_DESCEND
+        root = str(_HERE_RESOLVED)
+        root_len = len(root) + len(os.sep)
         files = []
-        try:
-            for item in sorted(root.rglob('*')):
-                rel   = item.relative_to(root)
-                parts = rel.parts
-                # 除外ディレクトリ配下は全スキップ
-                if any(p in _EXCLUDE_DIRS or p.startswith('.') and p != '.env' and p != '.gitignore'
-                       for p in parts[:-1]):
-                    continue
-                if item.name in _EXCLUDE_DIRS:
+
+        def _walk(dir_path: str):
+            """os.scandir で走査し、除外ディレクトリ・隠しディレクトリの配下には降りない。
+            DirEntry のキャッシュ済み種別・stat を使う。"""
+            try:
+                with os.scandir(dir_path) as it:
+                    entries = list(it)
+            except PermissionError:
+                return
+            for entry in entries:
+                name = entry.name
+                if name in exclude_names:
                     continue
-                if item.suffix in _EXCLUDE_EXTS:
+                if entry.is_dir(follow_symlinks=False) and (name[0] != '.' or name in dot_descend):
+                    _walk(entry.path)
+                if os.path.splitext(name)[1] in exclude_exts:
                     continue
                 try:
-                    stat = item.stat()
+                    stat   = entry.stat()
+                    is_dir = entry.is_dir()
                     files.append({
-                        'path':     str(rel).replace('\\', '/'),
-                        'is_dir':   item.is_dir(),
-                        'size':     0 if item.is_dir() else stat.st_size,
+                        'path':     entry.path[root_len:].replace('\\', '/'),
+                        'is_dir':   is_dir,
+                        'size':     0 if is_dir else stat.st_size,
                         'modified': _dt.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M'),
                     })
                 except OSError:
                     pass
+
+        try:
+            _walk(root)
+            # 旧実装 (sorted(Path.rglob)) と同じく、パス要素のタプル順で並べる
+            files.sort(key=lambda f: f['path'].split('/'))
         except Exception as e:
             self._send_json({'error': str(e)}, 500)
             return
@@ -803,11 +2231,8 @@ class JinjerHandler(BaseHTTPRequestHandler):
         if not file_path:
             self._send_json({'error': 'path パラメータが必要です'}, 400)
             return
-        # パストラバーサル防止
-        try:
-            target = (_HERE / file_path).resolve()
-            target.relative_to(_HERE.resolve())
-        except (ValueError, OSError):
+        target = _safe_path(file_path)
+        if target is None:
             self._send_json({'error': '不正なパスです'}, 403)
             return
         if not target.exists() or target.is_dir():
@@ -821,14 +2246,31 @@ class JinjerHandler(BaseHTTPRequestHandler):
             return
         _MAX = 200 * 1024  # 200KB
         try:
-            raw = target.read_text(encoding='utf-8', errors='replace')
+            with open(target, 'rb') as f:
+                # mtime / size が前回と同じならエンコード済みレスポンスを再利用 (ETag で 304 も返せる)
+                st = os.fstat(f.fileno())
+                key = (file_path, str(target))
+                hit = _files_read_cache.get(key)
+                if hit and hit[0] == st.st_mtime_ns and hit[1] == st.st_size:
+                    self._send_cached_json(hit[2])
+                    return
+                # 大きなファイルも _MAX + 1 バイトだけ読む
+                raw = f.read(_MAX + 1)
             truncated = len(raw) > _MAX
-            self._send_json({
+            # _MAX で切ったときだけ、末尾で切れたマルチバイト文字を (final=False の) デコーダで捨てる。
+            # 切っていないファイル自体の末尾が不完全なら、従来どおり U+FFFD にする
+            content = codecs.getincrementaldecoder('utf-8')('replace').decode(raw[:_MAX], final=not truncated)
+            entry = _json_cache_entry({
                 'path':      file_path,
-                'content':   raw[:_MAX],
-                'size':      target.stat().st_size,
+                'content':   content,
+                'size':      st.st_size,
                 'truncated': truncated,
             })
+            with _files_read_lock:
+                if len(_files_read_cache) >= _FILES_READ_CACHE_MAX:
+                    _files_read_cache.pop(next(iter(_files_read_cache)))   # 最古のエントリを捨てる
+                _files_read_cache[key] = (st.st_mtime_ns, st.st_size, entry)
+            self._send_cached_json(entry)
         except Exception as e:
             self._send_json({'error': str(e)}, 500)
 
@@ -847,19 +2289,21 @@ class JinjerHandler(BaseHTTPRequestHandler):
             log_file_name = 'watchdog.log' if log_type == 'watchdog' else 'server.log'
             log_file = _LOG_DIR / log_file_name
 
-        if not log_file.exists():
+        try:
+            # ファイル全体を読まず末尾だけ読む (server.log は数十 MB になりうる)
+            recent = _tail_lines(log_file, lines_n)
+            total = _count_lines(log_file)
+        except FileNotFoundError:
             self._send_json({'error': 'ログファイルが見つかりません', 'type': log_type, 'date': date_str or 'latest'}, 404)
             return
-        all_lines = log_file.read_text(encoding='utf-8', errors='replace').splitlines()
-        recent = all_lines[-lines_n:] if len(all_lines) > lines_n else all_lines
-        self._send_json({'type': log_type, 'date': date_str or 'latest', 'lines': recent, 'total': len(all_lines)})
+        self._send_json({'type': log_type, 'date': date_str or 'latest', 'lines': recent, 'total': total})
 
     def _handle_log_dates(self):
         """利用可能な日付アーカイブ一覧を返す"""
         dates = []
         if _LOG_ARCHIVE_DIR.exists():
             for d in sorted(_LOG_ARCHIVE_DIR.iterdir(), reverse=True):
-                if d.is_dir() and re.match(r'^\d{4}-\d{2}-\d{2}$', d.name):
+                if d.is_dir() and _LOG_DATE_RE.match(d.name):
                     files = [f.name for f in d.iterdir() if f.is_file()]
                     dates.append({'date': d.name, 'files': files})
         self._send_json({'dates': dates, 'archive_dir': str(_LOG_ARCHIVE_DIR), 'count': len(dates)})
@@ -881,48 +2325,109 @@ class JinjerHandler(BaseHTTPRequestHandler):
         '.webmanifest': 'application/manifest+json',
     }
 
+    # 圧縮して返す Content-Type (前方一致)。画像・フォント等は圧縮済みなので対象外
+    _COMPRESSIBLE_MIME = ('text/', 'application/javascript', 'application/json',
+                          'application/manifest+json', 'image/svg+xml')
+    # これより大きい非圧縮対象ファイルは sendfile で送る
+    _SENDFILE_MIN = 16 * 1024
+    _HTML_CSP = (
+        "default-src 'self' 'unsafe-inline' 'unsafe-eval' data: blob: "
+        "https://api.anthropic.com https://api.openai.com "
+        "https://generativelanguage.googleapis.com "
+        "https://cdnjs.cloudflare.com https://cdn.jsdelivr.net "
+        "https://unpkg.com https://fonts.googleapis.com "
+        "https://fonts.gstatic.com; "
+        "connect-src * blob:; "
+        "img-src * data: blob:; "
+        "frame-src 'self' http://localhost:7681 http://*.local:7681 http://100.*:7681;"
+    )
+
     def _send_static(self, rel_path: str):
         """静的ファイルを配信する (パストラバーサル対策済み)"""
-        try:
-            target = (_HERE / rel_path.lstrip('/')).resolve()
-            target.relative_to(_HERE.resolve())  # パストラバーサル防止
-        except (ValueError, OSError):
+        target = _safe_path(rel_path.lstrip('/'))
+        if target is None:
             self._send_json({'error': 'Forbidden'}, 403)
             return
-        if not target.exists() or target.is_dir():
+        try:
+            st = target.stat()
+        except OSError:
+            st = None
+        if st is None or _stat.S_ISDIR(st.st_mode):
             self._send_json({'error': 'Not found'}, 404)
             return
         mime = self._MIME_MAP.get(target.suffix.lower(), 'application/octet-stream')
+        # SW / マニフェストはキャッシュを無効化（常に最新を使用）
+        if target.name in ('sw.js', 'manifest.json'):
+            cache_control = 'no-cache, no-store, must-revalidate'
+        else:
+            cache_control = 'max-age=3600'
+        compressible = mime.startswith(self._COMPRESSIBLE_MIME)
         try:
-            body = target.read_bytes()
+            if not compressible and st.st_size > self._SENDFILE_MIN:
+                self._sendfile_static(target, mime, cache_control)
+                return
+            body, etag, compressed = _static_cached(target, st)
+            encoding = self._compression_for(len(body)) if compressible else None
+            # 強い ETag は Content-Encoding ごとに別の値にする (同じ値だとキャッシュ / プロキシが
+            # 別エンコーディングの本文を返したり再検証したりしうる)
+            if encoding is not None:
+                etag = f'{etag[:-1]}-{self._ETAG_SUFFIX[encoding]}"'
+            if self._etag_matches(etag):
+                self._send_static_304(etag, cache_control, vary=compressible)
+                return
+            # テキスト系は圧縮結果もファイル単位でキャッシュする (index.html は数百 KB あるため)
+            if encoding is not None:
+                if encoding not in compressed:
+                    compressed[encoding] = (brotli.compress(body, quality=9) if encoding == 'br'
+                                            else gzip.compress(body, compresslevel=9))
+                body = compressed[encoding]
             self.send_response(200)
             self.send_header('Content-Type', mime)
             self.send_header('Content-Length', str(len(body)))
-            # SW / マニフェストはキャッシュを無効化（常に最新を使用）
-            if target.name in ('sw.js', 'manifest.json'):
-                self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
-            else:
-                self.send_header('Cache-Control', 'max-age=3600')
+            if encoding is not None:
+                self.send_header('Content-Encoding', encoding)
+            if compressible:
+                self.send_header('Vary', 'Accept-Encoding')
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', cache_control)
             self.send_header('X-Content-Type-Options', 'nosniff')
             self.send_header('X-Frame-Options', 'SAMEORIGIN')
             # HTML ページには Content-Security-Policy を付与
             if target.suffix.lower() == '.html':
-                self.send_header('Content-Security-Policy',
-                    "default-src 'self' 'unsafe-inline' 'unsafe-eval' data: blob: "
-                    "https://api.anthropic.com https://api.openai.com "
-                    "https://generativelanguage.googleapis.com "
-                    "https://cdnjs.cloudflare.com https://cdn.jsdelivr.net "
-                    "https://unpkg.com https://fonts.googleapis.com "
-                    "https://fonts.gstatic.com; "
-                    "connect-src * blob:; "
-                    "img-src * data: blob:; "
-                    "frame-src 'self' http://localhost:7681 http://*.local:7681 http://100.*:7681;"
-                )
-            self.end_headers()
-            self.wfile.write(body)
+                self.send_header('Content-Security-Policy', self._HTML_CSP)
+            self._end_headers_with_body(body)
         except Exception as e:
             self._send_json({'error': str(e)}, 500)
 
+    _ETAG_SUFFIX = {'br': 'br', 'gzip': 'gz'}   # 圧縮した本文の ETag に付ける接尾辞
+
+    def _send_static_304(self, etag: str, cache_control: str, vary: bool = False):
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', cache_control)
+        if vary:
+            self.send_header('Vary', 'Accept-Encoding')
+        self.end_headers()
+
+    def _sendfile_static(self, target: Path, mime: str, cache_control: str):
+        """大きいバイナリ (画像・フォント) はメモリに載せず sendfile でそのまま送る"""
+        with open(target, 'rb') as f:
+            st = os.fstat(f.fileno())
+            etag = f'W/"{st.st_size:x}-{st.st_mtime_ns:x}"'
+            if self._etag_matches(etag):
+                self._send_static_304(etag, cache_control)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', mime)
+            self.send_header('Content-Length', str(st.st_size))
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', cache_control)
+            self.send_header('X-Content-Type-Options', 'nosniff')
+            self.send_header('X-Frame-Options', 'SAMEORIGIN')
+            self.end_headers()
+            self.wfile.flush()
+            self.connection.sendfile(f, 0, st.st_size)
+
     def _send_static_abs(self, abs_path: str):
         """絶対パスを指定して静的ファイルを配信する (SNS Collector UI 用)。"""
         target = Path(abs_path)
@@ -937,8 +2442,7 @@ class JinjerHandler(BaseHTTPRequestHandler):
             self.send_header('Content-Length', str(len(body)))
             self.send_header('Cache-Control', 'no-cache, no-store, must-revalidate')
             self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(body)
+            self._end_headers_with_body(body)
         except Exception as e:
             self._send_json({'error': str(e)}, 500)
 
@@ -1045,7 +2549,7 @@ class JinjerHandler(BaseHTTPRequestHandler):
             self._send_json({'error': 'フルバックアップが見つかりません'}, 404)
             return
         try:
-            data = json.loads(f.read_text(encoding='utf-8'))
+            data = _json_loads(f.read_bytes())
             self._send_json(data)
         except Exception as e:
             self._send_json({'error': str(e)}, 500)
@@ -1059,13 +2563,14 @@ class JinjerHandler(BaseHTTPRequestHandler):
         try:
             body['_server_saved_at'] = _dt.now().isoformat()
             f = JinjerHandler.FULL_BACKUP_FILE
-            f.write_text(json.dumps(body, ensure_ascii=False, indent=2), encoding='utf-8')
+            content = _json_dumps(body)   # ローカルと iCloud で同じバイト列を使う
+            f.write_bytes(content)
             # iCloud にもコピー
             icloud_ok = False
             try:
                 icloud_f = ICLOUD_ATT_DIR / 'kintai_full_backup.json'
                 ICLOUD_ATT_DIR.mkdir(parents=True, exist_ok=True)
-                icloud_f.write_text(json.dumps(body, ensure_ascii=False, indent=2), encoding='utf-8')
+                icloud_f.write_bytes(content)
                 icloud_ok = True
             except Exception:
                 pass
@@ -1077,11 +2582,19 @@ class JinjerHandler(BaseHTTPRequestHandler):
         """ファイルストアからデータを返す。ファイルが存在しなければ空を返す。"""
         if data_file.exists():
             try:
-                raw = data_file.read_text(encoding='utf-8')
-                data = json.loads(raw)
-                # 最終更新時刻を付与
-                stat = data_file.stat()
-                data['_server_updated_at'] = _dt.fromtimestamp(stat.st_mtime).isoformat()
+                with open(data_file, 'rb') as f:
+                    raw = f.read()
+                    updated_at = _dt.fromtimestamp(os.fstat(f.fileno()).st_mtime).isoformat()
+                # 最終更新時刻を付与。パースし直さず、末尾の } の直前にキーを継ぎ足して返す
+                # (保存済みのキーと重複しても JSON.parse は後勝ちなので付与した値が使われる)
+                body = raw.strip()
+                if body[:1] == b'{' and body[-1:] == b'}' and not self._wants_pretty():
+                    head = body[:-1].rstrip()
+                    sep = b'' if head == b'{' else b','
+                    self._send_json_raw(head + sep + b'"_server_updated_at":"' + updated_at.encode() + b'"}')
+                    return
+                data = _json_loads(raw)
+                data['_server_updated_at'] = updated_at
                 self._send_json(data)
                 return
             except Exception as e:
@@ -1091,26 +2604,23 @@ class JinjerHandler(BaseHTTPRequestHandler):
         self._send_json({'months': {}, '_server_updated_at': None})
 
     def _handle_data_post(self, data_file: Path):
-        """データをファイルストアに保存する。自動バックアップ付き。"""
+        """データをファイルストアに保存する。自動バックアップ付き。
+
+        応答の icloud はカレンダーデータのときだけ {'scheduled': True, 'delay': 秒} (バックアップは予約のみで、
+        ICLOUD_BACKUP_DEBOUNCE 秒後に書く)。それ以外は {}。
+        """
         body = self._read_body()
         if not body:
             self._send_json({'error': 'ボディが空です'}, 400)
             return
         try:
-            # 既存ファイルがあればローテーションバックアップ (最大3世代)
-            if data_file.exists():
-                bak = data_file.with_suffix(f'.bak{int(time.time())}')
-                data_file.rename(bak)
-                # 古いバックアップを3世代を超えたら削除
-                baks = sorted(data_file.parent.glob(data_file.stem + '.bak*'), key=lambda p: p.stat().st_mtime)
-                for old in baks[:-3]:
-                    old.unlink(missing_ok=True)
+            # 直前の内容をバックアップ (最大3世代) してから置き換える。?pretty=1 のときだけ整形して保存
             body['_server_saved_at'] = _dt.now().isoformat()
-            data_file.write_text(json.dumps(body, ensure_ascii=False, indent=2), encoding='utf-8')
-            # カレンダーデータの場合は iCloud にも自動バックアップ
+            _write_data_file(data_file, _json_dumps(body, pretty=self._wants_pretty()))
+            # カレンダーデータの場合は iCloud にも自動バックアップ (連続保存はまとめて最後の内容を書く)
             icloud_result = {}
             if data_file == KINTAI_DATA_FILE and body.get('months'):
-                icloud_result = _icloud_backup(body)
+                icloud_result = _icloud_backup_later(body)
             self._send_json({'ok': True, 'saved_at': body['_server_saved_at'],
                              'icloud': icloud_result})
         except Exception as e:
@@ -1125,59 +2635,22 @@ class JinjerHandler(BaseHTTPRequestHandler):
         method = 'none'
 
         # ── 方法1: serve 設定から直接取得 ──────────────────────────────────
-        ts_bins = _TS_BINS
-        for ts_bin in ts_bins:
-            try:
-                r = subprocess.run(
-                    [ts_bin, 'serve', 'status', '--json'],
-                    capture_output=True, text=True, timeout=5
-                )
-                if r.returncode == 0 and r.stdout.strip():
-                    data = json.loads(r.stdout)
-                    dns = (data.get('Self', {}).get('DNSName', '') or '').rstrip('.')
-                    if dns:
-                        https_url = f'https://{dns}'
-                        method = 'serve-status'
-                        break
-            except Exception:
-                continue
+        data = _tailscale_json('serve', 'status')
+        dns = ((data or {}).get('Self', {}).get('DNSName', '') or '').rstrip('.')
+        if dns:
+            https_url = f'https://{dns}'
+            method = 'serve-status'
 
         # ── 方法2: tailscale status からホスト名を取得 ────────────────────
         if not https_url:
-            for ts_bin in ts_bins:
-                try:
-                    r2 = subprocess.run(
-                        [ts_bin, 'status', '--json'],
-                        capture_output=True, text=True, timeout=5
-                    )
-                    if r2.returncode == 0 and r2.stdout.strip():
-                        data2 = json.loads(r2.stdout)
-                        dns2 = (data2.get('Self', {}).get('DNSName', '') or '').rstrip('.')
-                        if dns2:
-                            https_url = f'https://{dns2}'
-                            method = 'status'
-                            break
-                except Exception:
-                    continue
+            data2 = _tailscale_json('status')
+            dns2 = ((data2 or {}).get('Self', {}).get('DNSName', '') or '').rstrip('.')
+            if dns2:
+                https_url = f'https://{dns2}'
+                method = 'status'
 
         # ── 方法3: tailscale ip -4 でIPアドレスを直接取得 ──────────────────
-        # App Store 版 → Homebrew 版の順に試す (有効な IPv4 のみ採用)
-        import re as _re2
-        _ipv4_re2 = _re2.compile(r'^(\d{1,3}\.){3}\d{1,3}$')
-        tailscale_ip = None
-        for ts_bin in _TS_BINS:
-            try:
-                r3 = subprocess.run(
-                    [ts_bin, 'ip', '-4'],
-                    capture_output=True, text=True, timeout=5
-                )
-                if r3.returncode == 0:
-                    ip = r3.stdout.strip().splitlines()[0].strip()
-                    if ip and _ipv4_re2.match(ip):
-                        tailscale_ip = ip
-                        break
-            except Exception:
-                continue
+        tailscale_ip = _tailscale_ipv4()
 
         http_url = f'http://{tailscale_ip}:8899' if tailscale_ip else None
 
@@ -1546,44 +3019,22 @@ class JinjerHandler(BaseHTTPRequestHandler):
                 ts_url  = f'http://{_TS_MAC_HOST or _TS_MAC_IP}:{PORT}'
             else:
                 # 2. CLI から検出（フォールバック）
-                import re as _re
-                _ipv4_re = _re.compile(r'^(\d{1,3}\.){3}\d{1,3}$')
-                for ts_bin in _TS_BINS:
-                    try:
-                        r = subprocess.run([ts_bin, 'ip', '-4'],
-                                           capture_output=True, text=True, timeout=3)
-                        if r.returncode == 0:
-                            ip = r.stdout.strip().splitlines()[0].strip()
-                            if ip and _ipv4_re.match(ip):
-                                ts_ip  = ip
-                                ts_url = f'http://{ip}:{PORT}'
-                                break
-                    except Exception:
-                        continue
+                ts_ip = _tailscale_ipv4()
+                if ts_ip:
+                    ts_url = f'http://{ts_ip}:{PORT}'
 
             # 3. tailscale serve status で HTTPS URL を検出
             # JSON 構造例: {"Web": {"hostname.ts.net:443": {"Handlers": {"/": ...}}}}
-            for ts_bin in _TS_BINS:
-                try:
-                    rs = subprocess.run(
-                        [ts_bin, 'serve', 'status', '--json'],
-                        capture_output=True, text=True, timeout=5
-                    )
-                    if rs.returncode == 0 and rs.stdout.strip():
-                        sd = json.loads(rs.stdout)
-                        # Web キーから "hostname.ts.net:443" を抽出
-                        web_keys = sd.get('Web', {})
-                        for web_key in web_keys:
-                            host_part = web_key.split(':')[0]  # "hostname.ts.net"
-                            if host_part:
-                                ts_https_url = f'https://{host_part}'
-                                ts_serve_active = True
-                                if not ts_host:
-                                    ts_host = host_part
-                                break
-                        break
-                except Exception:
-                    continue
+            sd = _tailscale_json('serve', 'status')
+            # Web キーから "hostname.ts.net:443" を抽出
+            for web_key in (sd or {}).get('Web', {}):
+                host_part = web_key.split(':')[0]  # "hostname.ts.net"
+                if host_part:
+                    ts_https_url = f'https://{host_part}'
+                    ts_serve_active = True
+                    if not ts_host:
+                        ts_host = host_part
+                    break
 
         result = {
             'lan_ip':          host_ip or None,
@@ -1645,8 +3096,15 @@ class JinjerHandler(BaseHTTPRequestHandler):
         except Exception as ex:
             self._send_json({'error': str(ex)}, 500)
 
+    @staticmethod
+    def _body_str(data: dict, key: str, default: str = '') -> str:
+        """ボディの文字列項目を前後の空白を除いて返す (未指定・文字列以外なら default)"""
+        value = data.get(key, default)
+        return value.strip() if isinstance(value, str) else default
+
     def _read_body_raw(self) -> bytes:
         """リクエストボディを bytes で読み込む。"""
+        self._body_consumed = True
         try:
             length = int(self.headers.get('Content-Length', 0))
             return self.rfile.read(length) if length > 0 else b''
@@ -1663,6 +3121,45 @@ class JinjerHandler(BaseHTTPRequestHandler):
               if os.path.exists(p)), 'docker')
     )
 
+    # /api/health の Docker 稼働状況は監視のたびに docker info を起動しないよう一定時間キャッシュする
+    _HEALTH_DOCKER_TTL = 15
+    _health_docker: tuple[float, str | None] = (0.0, None)
+    _health_docker_lock = threading.Lock()
+
+    def _health_docker_info(self) -> str | None:
+        """Docker デーモン稼働チェック ("起動中/全コンテナ" or None)。更新中は前回値を返す"""
+        ts, info = JinjerHandler._health_docker
+        if time.time() - ts < self._HEALTH_DOCKER_TTL:
+            return info
+        if not JinjerHandler._health_docker_lock.acquire(blocking=False):
+            return info
+        try:
+            try:
+                if _docker_sock():
+                    d = _docker_api_json('GET', '/info', timeout=2)
+                    info = f"{d['ContainersRunning']}/{d['Containers']}"
+                else:
+                    dr, dout, _ = self._run_docker(
+                        ['info', '--format', '{{.ContainersRunning}}/{{.Containers}}'], timeout=2)
+                    info = dout.strip() if dr == 0 else None
+            except Exception:
+                info = None
+            JinjerHandler._health_docker = (time.time(), info)
+        finally:
+            JinjerHandler._health_docker_lock.release()
+        return info
+
+    # 状態を変える docker サブコマンド。実行後は一覧キャッシュを捨てる
+    _DOCKER_MUTATING = frozenset({'start', 'stop', 'restart', 'rm', 'rmi', 'run', 'pull', 'kill'})
+    _DOCKER_LIST_TTL = 5   # docker ps / images の結果を使い回す秒数 (macOS では 1 回数百 ms かかる)
+    # /events を購読できている間は変化のたびにキャッシュが捨てられるので、"Up 2 hours" 等の表示が古びない程度に長く持つ
+    _DOCKER_LIST_TTL_WATCHED = 30
+
+    def _docker_list_ttl(self) -> float:
+        if _docker_sock():
+            _ensure_docker_watcher()
+        return self._DOCKER_LIST_TTL_WATCHED if _docker_events_live.is_set() else self._DOCKER_LIST_TTL
+
     def _run_docker(self, args: list, timeout: int = 10) -> tuple[int, str, str]:
         """docker コマンドを実行して (returncode, stdout, stderr) を返す。"""
         try:
@@ -1670,22 +3167,32 @@ class JinjerHandler(BaseHTTPRequestHandler):
                 [self._DOCKER_BIN] + args,
                 capture_output=True, text=True, timeout=timeout
             )
+            if args and args[0] in self._DOCKER_MUTATING:
+                _drop_cached('docker-ps', 'docker-images')
             return r.returncode, r.stdout, r.stderr
         except FileNotFoundError:
             return -1, '', f'docker コマンドが見つかりません (探索パス: {self._DOCKER_BIN})'
         except subprocess.TimeoutExpired:
             return -1, '', 'docker command timed out'
 
-    def _handle_docker_containers(self):
-        """全コンテナの情報を返す (running + stopped)。"""
+    def _docker_containers(self) -> list:
+        """全コンテナ (running + stopped) の一覧。失敗時は RuntimeError"""
+        if _docker_sock():
+            return [{
+                'id':     c['Id'][:12],
+                'name':   (c.get('Names') or [''])[0].lstrip('/'),
+                'image':  c.get('Image', ''),
+                'status': c.get('Status', ''),
+                'ports':  _docker_ports(c.get('Ports') or []),
+                'state':  c.get('State', ''),
+            } for c in _docker_api_json('GET', '/containers/json?all=1')]
         rc, out, err = self._run_docker([
             'ps', '-a',
             '--format',
             '{{.ID}}\t{{.Names}}\t{{.Image}}\t{{.Status}}\t{{.Ports}}\t{{.State}}'
         ])
         if rc != 0:
-            self._send_json({'error': err or 'docker ps failed'}, 500)
-            return
+            raise RuntimeError(err or 'docker ps failed')
         containers = []
         for line in out.strip().splitlines():
             parts = line.split('\t')
@@ -1699,18 +3206,41 @@ class JinjerHandler(BaseHTTPRequestHandler):
                 'ports':  parts[4],
                 'state':  parts[5],
             })
-        self._send_json({'containers': containers})
+        return containers
 
-    def _handle_docker_images(self):
-        """イメージ一覧を返す。"""
+    def _handle_docker_containers(self):
+        """全コンテナの情報を返す (running + stopped)。"""
+        # エンコード済み body と ETag ごとキャッシュし、ポーリングには再シリアライズなしで返す
+        try:
+            entry = _cached_call('docker-ps', self._docker_list_ttl(),
+                                 lambda: _json_cache_entry({'containers': self._docker_containers()}))
+        except Exception as e:
+            self._send_json({'error': str(e)}, 500)
+            return
+        self._send_cached_json(entry)
+
+    def _docker_images(self) -> list:
+        """イメージ一覧 (docker images と同じくタグごとに 1 行)。失敗時は RuntimeError"""
+        if _docker_sock():
+            images = []
+            for img in _docker_api_json('GET', '/images/json'):
+                for repo_tag in img.get('RepoTags') or ['<none>:<none>']:
+                    repo, _, tag = repo_tag.rpartition(':')
+                    images.append({
+                        'id':      img['Id'].removeprefix('sha256:')[:12],
+                        'repo':    repo or '<none>',
+                        'tag':     tag or '<none>',
+                        'size':    _human_size(img.get('Size', 0)),
+                        'created': _human_since(img.get('Created', 0)),
+                    })
+            return images
         rc, out, err = self._run_docker([
             'images',
             '--format',
             '{{.ID}}\t{{.Repository}}\t{{.Tag}}\t{{.Size}}\t{{.CreatedSince}}'
         ])
         if rc != 0:
-            self._send_json({'error': err or 'docker images failed'}, 500)
-            return
+            raise RuntimeError(err or 'docker images failed')
         images = []
         for line in out.strip().splitlines():
             parts = line.split('\t')
@@ -1723,7 +3253,17 @@ class JinjerHandler(BaseHTTPRequestHandler):
                 'size':    parts[3],
                 'created': parts[4],
             })
-        self._send_json({'images': images})
+        return images
+
+    def _handle_docker_images(self):
+        """イメージ一覧を返す。"""
+        try:
+            entry = _cached_call('docker-images', self._docker_list_ttl(),
+                                 lambda: _json_cache_entry({'images': self._docker_images()}))
+        except Exception as e:
+            self._send_json({'error': str(e)}, 500)
+            return
+        self._send_cached_json(entry)
 
     def _handle_docker_logs(self, params: dict):
         """指定コンテナの直近ログを返す。"""
@@ -1736,6 +3276,22 @@ class JinjerHandler(BaseHTTPRequestHandler):
             n = max(1, min(int(lines), 500))
         except ValueError:
             n = 100
+        if params.get('format', [''])[0] == 'ndjson':
+            self._stream_docker_logs(cid, n)
+            return
+        if _docker_sock():
+            try:
+                status, raw = _docker_api(
+                    'GET', f'/containers/{cid}/logs?stdout=1&stderr=1&tail={n}', timeout=15)
+            except (OSError, http.client.HTTPException) as e:
+                self._send_json({'error': f'Docker デーモンに接続できません: {e}'}, 500)
+                return
+            if status != 200:
+                self._send_json({'error': _docker_error_message(raw) or 'docker logs failed'}, 500)
+                return
+            # stdout / stderr のフレームを出力順のまま 1 本のテキストにする
+            self._send_json({'id': cid, 'logs': _docker_demux(raw)})
+            return
         rc, out, err = self._run_docker(['logs', '--tail', str(n), cid], timeout=15)
         # docker logs writes to stderr for actual log content in some versions
         log_text = out + (('\n' + err) if err and rc == 0 else '')
@@ -1744,22 +3300,81 @@ class JinjerHandler(BaseHTTPRequestHandler):
             return
         self._send_json({'id': cid, 'logs': log_text})
 
+    def _stream_docker_logs(self, cid: str, n: int):
+        """?format=ndjson: 1 行 1 オブジェクト {"t": 時刻, "s": stdout|stderr, "m": 本文} を
+        chunked で流す。デーモンから届いたフレームを順に変換するので全体をメモリに持たない"""
+        if not _docker_sock():
+            self._send_json({'error': 'format=ndjson は Docker ソケットに接続できる環境でのみ使えます'}, 400)
+            return
+        conn = _UnixHTTPConnection(_docker_sock(), timeout=15)
+        try:
+            try:
+                conn.request('GET', f'/containers/{cid}/logs?stdout=1&stderr=1&timestamps=1&tail={n}',
+                             headers={'Host': 'docker'})
+                res = conn.getresponse()
+            except (OSError, http.client.HTTPException) as e:
+                self._send_json({'error': f'Docker デーモンに接続できません: {e}'}, 500)
+                return
+            if res.status != 200:
+                self._send_json({'error': _docker_error_message(res.read()) or 'docker logs failed'}, 500)
+                return
+            chunked = self._start_stream('application/x-ndjson; charset=utf-8')
+            buf = bytearray()
+            lines = _docker_log_lines(res)
+            while True:
+                # デーモン側の読み込みエラーだけを拾う (クライアントへの書き込みエラーはそのまま上げる)
+                try:
+                    item = next(lines, None)
+                except (OSError, http.client.HTTPException) as e:
+                    # ヘッダー送信後なのでステータスは変えられない。読めた行までは送り、終端チャンクを
+                    # 送らずに切断して、途中で切れたことをクライアントに分かるようにする
+                    print(f'[docker] logs ストリーム中断 ({cid}): {e}', flush=True)
+                    if buf:
+                        self._write_stream(buf, chunked)
+                    self.close_connection = True
+                    return
+                if item is None:
+                    break
+                stream, line = item
+                ts, _, msg = line.decode('utf-8', 'replace').partition(' ')
+                buf += _json_dumps({'t': ts, 's': stream, 'm': msg.rstrip('\r')}) + b'\n'
+                if len(buf) >= self._STREAM_FLUSH:
+                    self._write_stream(buf, chunked)
+                    buf.clear()
+            if buf:
+                self._write_stream(buf, chunked)
+            self._write_stream(b'', chunked)
+        finally:
+            conn.close()
+
     def _handle_docker_action(self):
         """コンテナ操作: start / stop / restart / rm。"""
-        body = self._read_body()
-        try:
-            data = json.loads(body)
-        except Exception:
+        data = self._read_body()
+        if not isinstance(data, dict):
             self._send_json({'error': 'invalid JSON'}, 400)
             return
         action = data.get('action', '')
-        cid    = data.get('id', '').strip()
+        cid    = self._body_str(data, 'id')
         if not cid or not cid.replace('-', '').replace('_', '').isalnum():
             self._send_json({'error': 'invalid id'}, 400)
             return
         if action not in ('start', 'stop', 'restart', 'rm'):
             self._send_json({'error': 'invalid action'}, 400)
             return
+        if _docker_sock():
+            try:
+                # 304 は「既に起動済み / 停止済み」で、CLI と同じく成功扱い
+                if action == 'rm':
+                    _docker_api_json('DELETE', f'/containers/{cid}?force=1', timeout=30, ok=(200, 204))
+                else:
+                    _docker_api_json('POST', f'/containers/{cid}/{action}', timeout=30, ok=(204, 304))
+            except RuntimeError as e:
+                self._send_json({'error': str(e)}, 500)
+                return
+            finally:
+                _drop_cached('docker-ps', 'docker-images')
+            self._send_json({'ok': True, 'action': action, 'id': cid})
+            return
         args = [action]
         if action == 'rm':
             args.append('-f')
@@ -1787,13 +3402,11 @@ class JinjerHandler(BaseHTTPRequestHandler):
 
     def _handle_docker_pull(self):
         """Docker Hub からイメージをプルする。"""
-        body = self._read_body()
-        try:
-            data = json.loads(body)
-        except Exception:
+        data = self._read_body()
+        if not isinstance(data, dict):
             self._send_json({'error': 'invalid JSON'}, 400)
             return
-        image = data.get('image', '').strip()
+        image = self._body_str(data, 'image')
         # 安全チェック: シェルメタキャラクタを禁止
         import re as _re2
         if not image or not _re2.match(r'^[a-zA-Z0-9_./:@-]+$', image):
@@ -1808,18 +3421,16 @@ class JinjerHandler(BaseHTTPRequestHandler):
 
     def _handle_docker_run(self):
         """コンテナを作成して起動する。"""
-        body = self._read_body()
-        try:
-            data = json.loads(body)
-        except Exception:
+        data = self._read_body()
+        if not isinstance(data, dict):
             self._send_json({'error': 'invalid JSON'}, 400)
             return
         import re as _re3
-        image   = data.get('image',   '').strip()
-        name    = data.get('name',    '').strip()
-        ports   = data.get('ports',   '').strip()   # "8080:80,9090:9090"
-        restart = data.get('restart', 'no').strip()
-        env_str = data.get('env',     '').strip()   # "KEY=VALUE\nKEY2=VALUE2"
+        image   = self._body_str(data, 'image')
+        name    = self._body_str(data, 'name')
+        ports   = self._body_str(data, 'ports')     # "8080:80,9090:9090"
+        restart = self._body_str(data, 'restart', 'no')
+        env_str = self._body_str(data, 'env')       # "KEY=VALUE\nKEY2=VALUE2"
 
         if not image or not _re3.match(r'^[a-zA-Z0-9_./:@-]+$', image):
             self._send_json({'error': 'invalid image name'}, 400)
@@ -1856,37 +3467,20 @@ class JinjerHandler(BaseHTTPRequestHandler):
     def _handle_backup_list(self):
         """iCloud Backup/ フォルダのバックアップ一覧を返す"""
         try:
-            backups = []
             # Backup/ ディレクトリのバックアップ一覧
-            if ICLOUD_BACKUP_DIR.exists():
-                for f in sorted(ICLOUD_BACKUP_DIR.glob('attendance_backup_*.json'),
-                                key=lambda p: p.stat().st_mtime, reverse=True):
-                    stat = f.stat()
-                    backups.append({
-                        'name':    f.name,
-                        'size_kb': round(stat.st_size / 1024, 1),
-                        'mtime':   _dt.fromtimestamp(stat.st_mtime).isoformat(),
-                    })
+            backups = _list_json_files(ICLOUD_BACKUP_DIR, 'attendance_backup_', cache=True)
             # メインバックアップ情報
             main_info = None
-            main_path = ICLOUD_ATT_DIR / 'attendance_backup.json'
-            if main_path.exists():
-                stat = main_path.stat()
+            try:
+                stat = os.stat(ICLOUD_ATT_DIR / 'attendance_backup.json')
                 main_info = {
                     'size_kb': round(stat.st_size / 1024, 1),
                     'mtime':   _dt.fromtimestamp(stat.st_mtime).isoformat(),
                 }
+            except FileNotFoundError:
+                pass
             # jinjer ファイル一覧
-            jinjer_files = []
-            if ICLOUD_JINJER_DIR.exists():
-                for f in sorted(ICLOUD_JINJER_DIR.glob('*.json'),
-                                key=lambda p: p.stat().st_mtime, reverse=True):
-                    stat = f.stat()
-                    jinjer_files.append({
-                        'name':    f.name,
-                        'size_kb': round(stat.st_size / 1024, 1),
-                        'mtime':   _dt.fromtimestamp(stat.st_mtime).isoformat(),
-                    })
+            jinjer_files = _list_json_files(ICLOUD_JINJER_DIR)
             self._send_json({
                 'icloud_dir':    str(ICLOUD_ATT_DIR),
                 'main':          main_info,
@@ -1914,25 +3508,50 @@ class JinjerHandler(BaseHTTPRequestHandler):
             self._send_json({'error': 'ファイルが見つかりません'}, 404)
             return
         try:
-            data = json.loads(target.read_text(encoding='utf-8'))
-            months = list(data.get('months', {}).keys())
-            self._send_json({
-                'name':   name,
-                'data':   data,
-                'months': months,
-                'mtime':  _dt.fromtimestamp(target.stat().st_mtime).isoformat(),
-            })
+            with open(target, 'rb') as f:
+                st = os.fstat(f.fileno())
+                pretty = self._wants_pretty()
+                # 検証済み (月一覧がキャッシュ済み) の大きいファイルを圧縮せずに返すなら、中身は sendfile で送る
+                if (not pretty and st.st_size >= self._SENDFILE_MIN
+                        and self._compression_for(st.st_size) is None):
+                    months = _backup_months(target, st)
+                    if months is not None:
+                        self._sendfile_json(f, st.st_size, self._backup_prefix(name, months, st), b'}')
+                        return
+                raw = f.read()
+            months = _backup_months(target, st, raw)
+            if pretty:
+                self._send_json({
+                    'name':   name,
+                    'months': months,
+                    'mtime':  _dt.fromtimestamp(st.st_mtime).isoformat(),
+                    'data':   _json_loads(raw),
+                })
+                return
+            # data はファイルの中身 (妥当な JSON) をそのまま埋め込み、パース → 再シリアライズを省く
+            self._send_json_raw(self._backup_prefix(name, months, st) + raw + b'}')
         except Exception as e:
             self._send_json({'error': str(e)}, 500)
 
+    @staticmethod
+    def _backup_prefix(name: str, months: list, st: os.stat_result) -> bytes:
+        """/api/backup/read のレスポンスのうち data の手前まで ('{"name":...,"data":')"""
+        meta = {
+            'name':   name,
+            'months': months,
+            'mtime':  _dt.fromtimestamp(st.st_mtime).isoformat(),
+        }
+        return _json_dumps(meta)[:-1] + b',"data":'
+
     def _handle_backup_now(self):
         """手動で iCloud バックアップを今すぐ実行する"""
         try:
             if not KINTAI_DATA_FILE.exists():
                 self._send_json({'error': 'kintai_store.json が存在しません。先にデータを保存してください。'}, 404)
                 return
-            data = json.loads(KINTAI_DATA_FILE.read_text(encoding='utf-8'))
-            result = _icloud_backup(data, label='manual')
+            _discard_icloud_backup()
+            data = _json_loads(KINTAI_DATA_FILE.read_bytes())
+            result = _icloud_backup(data, label='manual', force=True)
             self._send_json(result)
         except Exception as e:
             self._send_json({'error': str(e)}, 500)
@@ -1953,19 +3572,16 @@ class JinjerHandler(BaseHTTPRequestHandler):
             self._send_json({'error': f'バックアップファイルが見つかりません: {src.name}'}, 404)
             return
         try:
-            data = json.loads(src.read_text(encoding='utf-8'))
+            data = _json_loads(src.read_bytes())
             months = list(data.get('months', {}).keys())
             if not months:
                 self._send_json({'error': 'バックアップデータに月データがありません'}, 400)
                 return
-            # 既存ファイルをローテーションバックアップしてから上書き
-            if KINTAI_DATA_FILE.exists():
-                bak = KINTAI_DATA_FILE.with_suffix(f'.bak{int(time.time())}')
-                KINTAI_DATA_FILE.rename(bak)
             data['_server_saved_at']    = _dt.now().isoformat()
             data['_restored_from']      = src.name
             data['_restored_at']        = _dt.now().isoformat()
-            KINTAI_DATA_FILE.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding='utf-8')
+            # 既存ファイルをローテーションバックアップしてから上書き
+            _write_data_file(KINTAI_DATA_FILE, _json_dumps(data))
             self._send_json({
                 'ok':     True,
                 'source': src.name,
@@ -1990,13 +3606,37 @@ class JinjerHandler(BaseHTTPRequestHandler):
 
 
 def _server_is_alive(port: int) -> bool:
-    """ポートで自サーバーが応答するか確認 (タイムアウト 2 秒)"""
+    """ポートで自サーバーが応答するか確認 (タイムアウト 2 秒)。
+    何も待ち受けていなければ connect が即座に失敗する。応答確認には処理のない /api/ping を使う"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
     try:
-        req = urllib.request.Request(f'http://127.0.0.1:{port}/api/structure')
-        with urllib.request.urlopen(req, timeout=2):
-            return True
-    except Exception:
+        conn.request('GET', '/api/ping')
+        return conn.getresponse().status == 200
+    except (OSError, http.client.HTTPException):
+        return False
+    finally:
+        conn.close()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
         return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _port_free(port: int) -> bool:
+    """サーバー本体と同じ条件 (SO_REUSEADDR) で bind できるか"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            s.bind(('', port))
+        except OSError:
+            return False
+    return True
 
 
 def _kill_port(port: int) -> bool:
@@ -2004,14 +3644,23 @@ def _kill_port(port: int) -> bool:
     try:
         pids: list[str] = []
 
+        # 方法0: psutil (インストール済みならプロセス内で完結。macOS で権限不足なら次の方法へ)
+        if _PSUTIL_OK:
+            try:
+                pids = sorted({str(c.pid) for c in psutil.net_connections(kind='inet')
+                               if c.laddr and c.laddr.port == port and c.pid and c.pid != os.getpid()})
+            except (psutil.Error, OSError):
+                pids = []
+
         # 方法1: lsof (macOS + 一部 Linux)
-        try:
-            r = subprocess.run(['lsof', '-ti', f':{port}'],
-                               capture_output=True, text=True, timeout=5)
-            if r.returncode == 0:
-                pids = [p.strip() for p in r.stdout.strip().splitlines() if p.strip()]
-        except (FileNotFoundError, subprocess.TimeoutExpired):
-            pass
+        if not pids:
+            try:
+                r = subprocess.run(['lsof', '-ti', f':{port}'],
+                                   capture_output=True, text=True, timeout=5)
+                if r.returncode == 0:
+                    pids = [p.strip() for p in r.stdout.strip().splitlines() if p.strip()]
+            except (FileNotFoundError, subprocess.TimeoutExpired):
+                pass
 
         # 方法2: fuser (Linux 標準)
         if not pids:
@@ -2030,20 +3679,28 @@ def _kill_port(port: int) -> bool:
                 r = subprocess.run(['ss', '-tlnp', f'sport = :{port}'],
                                    capture_output=True, text=True, timeout=5)
                 if r.returncode == 0:
-                    for m in re.finditer(r'pid=(\d+)', r.stdout):
+                    for m in _PID_RE.finditer(r.stdout):
                         pids.append(m.group(1))
             except (FileNotFoundError, subprocess.TimeoutExpired):
                 pass
 
         if not pids:
             return False
+        killed: set[int] = set()
         for pid in pids:
             try:
                 os.kill(int(pid), _signal.SIGTERM)
+                killed.add(int(pid))
                 print(f'  既存プロセス (PID {pid}) を終了しました')
             except (ProcessLookupError, ValueError):
                 pass
-        time.sleep(2.0)
+        # 一律 2 秒待たず、終了を 100ms 間隔で確認する (最大 2 秒)
+        deadline = time.monotonic() + 2.0
+        while killed and time.monotonic() < deadline:
+            time.sleep(0.1)
+            killed = {pid for pid in killed if _pid_alive(pid)}
+            if _port_free(port):
+                break
         return True
     except Exception as ex:
         print(f'  プロセス終了エラー: {ex}')
@@ -2107,6 +3764,14 @@ if __name__ == '__main__':
 
     print(_BANNER.format(port=PORT))
 
+    # ─── sync_jinjer / report_sync をバックグラウンドで先読み ───────────────
+    # bind 後に読み込むことで起動直後のヘルスチェックを待たせない
+    def _warmup_imports():
+        _ensure_scraper()
+        _ensure_reports()
+
+    threading.Thread(target=_warmup_imports, daemon=True, name='import-warmup').start()
+
     # ─── LAN IP を data/host_ip.txt に書き込む（Docker からも参照可能）────────
     if not os.path.exists('/.dockerenv'):
         try:
@@ -2128,53 +3793,89 @@ if __name__ == '__main__':
     _LOG_DIR              = _HERE / 'logs'
     _LOG_ARCHIVE_DIR      = _HERE / 'logs' / 'dates'  # 日付別アーカイブ
     _LOG_ARCHIVE_KEEP_DAYS = 90               # サーバーログ保持期間（ディスク節約）
+    # ローテーション対象 (1 時間ごとに作り直さないよう起動時に 1 度だけ組み立てる)
+    _LOG_PATHS = tuple(_LOG_DIR / name for name in (
+        'server.log', 'server_err.log', 'watchdog.log', 'watchdog_err.log',
+        'jinjer_end.log', 'jinjer_end_err.log', 'memo.log'))
+    # 定期処理スレッドの停止合図 (sleep ではなくこれを wait し、停止時に最大 1 時間待たされないようにする)
+    _bg_stop = threading.Event()
 
     def _rotate_one(log_path: Path):
         """1ファイルのローテーション: path.5 を削除 → .4→.5 … → path→.1"""
+        # ローテーション不要な大半のケースは stat 1 回で終わらせる。
+        # 世代のシフトも存在確認せずに rename し、無ければ ENOENT を無視する
+        try:
+            size = os.stat(log_path).st_size
+        except FileNotFoundError:
+            return
+        if size < _LOG_MAX_BYTES:
+            return
         try:
-            if not log_path.exists() or log_path.stat().st_size < _LOG_MAX_BYTES:
-                return
             # 最古世代を削除してからシフト
-            oldest = log_path.with_suffix(f'.log.{_LOG_KEEP}')
-            if oldest.exists():
-                oldest.unlink()
+            base = str(log_path)
+            try:
+                os.unlink(f'{base}.{_LOG_KEEP}')
+            except FileNotFoundError:
+                pass
             for i in range(_LOG_KEEP - 1, 0, -1):
-                src = log_path.with_suffix(f'.log.{i}')
-                dst = log_path.with_suffix(f'.log.{i+1}')
-                if src.exists():
-                    src.rename(dst)
+                try:
+                    os.rename(f'{base}.{i}', f'{base}.{i + 1}')
+                except FileNotFoundError:
+                    pass
             # 現在のファイルを .1 に移動（launchd は新しいファイルに自動で書き続ける）
-            log_path.rename(log_path.with_suffix('.log.1'))
-            print(f'[INFO] ログローテーション: {log_path.name} → .1 ({log_path.stat().st_size if log_path.exists() else "新規"})', flush=True)
+            os.rename(base, f'{base}.1')
+            print(f'[INFO] ログローテーション: {log_path.name} → .1 ({size} bytes)', flush=True)
         except Exception as ex:
             print(f'[WARN] ログローテーション失敗 ({log_path.name}): {ex}', flush=True)
 
     def _rotate_logs():
         """全ログファイルをローテーション"""
-        for name in ('server.log', 'server_err.log', 'watchdog.log', 'watchdog_err.log',
-                     'jinjer_end.log', 'jinjer_end_err.log', 'memo.log'):
-            _rotate_one(_LOG_DIR / name)
-
-    def _rotate_loop():
-        """起動時に1回 + 以降1時間ごとに実行"""
-        _rotate_logs()
-        while True:
-            time.sleep(_LOG_ROTATE_INTERVAL)
-            _rotate_logs()
-
-    threading.Thread(target=_rotate_loop, daemon=True, name='log-rotator').start()
+        for log_path in _LOG_PATHS:
+            _rotate_one(log_path)
 
     # ─── 日次ログアーカイブ (SysLog HA: 90日保持) ────────────────────────────
+    def _archive_one(src_f: Path, dst: Path, prev: Path | None):
+        """src_f のスナップショットを dst に置く。前回のアーカイブ (prev) 以降に書かれていなければ
+        コピーせず prev へのハードリンクで済ませる (静かなログを毎日丸ごと複製しない)。
+        追記中のログ本体へ直接リンクすると以後の追記まで反映されるので、その場合はコピーする"""
+        st = os.stat(src_f)
+
+        def same(path: Path | None) -> bool:
+            if path is None:
+                return False
+            try:
+                o = os.stat(path)
+            except FileNotFoundError:
+                return False
+            # copy2 は mtime を引き継ぐので、サイズと mtime が同じなら中身も同じ
+            return o.st_size == st.st_size and o.st_mtime_ns == st.st_mtime_ns
+
+        if same(dst):
+            return   # 同じ日に再起動した場合など、既に最新
+        if same(prev):
+            dst.unlink(missing_ok=True)
+            try:
+                os.link(prev, dst)
+                return
+            except OSError:
+                pass
+        shutil.copy2(src_f, dst)
+
     def _archive_logs_daily():
         """前日の server.log, watchdog.log を logs/dates/YYYY-MM-DD/ にコピー"""
         try:
             yesterday = (_dt.now() - _td(days=1)).strftime('%Y-%m-%d')
             arc_dir = _LOG_ARCHIVE_DIR / yesterday
             arc_dir.mkdir(parents=True, exist_ok=True)
+            # 直前のアーカイブ日 (ディレクトリ名は YYYY-MM-DD なので文字列順 = 日付順)
+            prev_day = max((d for d in os.listdir(_LOG_ARCHIVE_DIR)
+                            if _LOG_DATE_RE.match(d) and d < yesterday), default=None)
             for name in ('server.log', 'watchdog.log'):
-                src_f = _LOG_DIR / name
-                if src_f.exists():
-                    shutil.copy2(src_f, arc_dir / name)
+                try:
+                    _archive_one(_LOG_DIR / name, arc_dir / name,
+                                 _LOG_ARCHIVE_DIR / prev_day / name if prev_day else None)
+                except FileNotFoundError:
+                    pass
             print(f'[INFO] 日次ログアーカイブ完了: {arc_dir}', flush=True)
             # 90日以上前のアーカイブを削除
             cutoff = _dt.now() - _td(days=_LOG_ARCHIVE_KEEP_DAYS)
@@ -2188,28 +3889,61 @@ if __name__ == '__main__':
         except Exception as ex:
             print(f'[WARN] 日次ログアーカイブ失敗: {ex}', flush=True)
 
-    def _daily_archive_loop():
-        """起動時に1回実行、以降は毎日0時30秒に実行"""
+    def _next_archive_time() -> _dt:
+        return (_dt.now() + _td(days=1)).replace(hour=0, minute=0, second=30, microsecond=0)
+
+    def _log_maintenance_loop():
+        """ログのローテーション (起動時 + 1時間ごと) と日次アーカイブ (起動時 + 毎日0時30秒) を
+        1 本のスレッドで回す。次に期限が来る方まで待ち、期限の来たものを実行する。
+        アーカイブは壁時計基準なので、時計の変更やスリープ復帰に備え最大 1 時間ごとに見直す"""
+        _rotate_logs()
         _archive_logs_daily()
+        next_rotate = time.monotonic() + _LOG_ROTATE_INTERVAL
+        next_archive = _next_archive_time()
         while True:
-            now = _dt.now()
-            nxt = (now + _td(days=1)).replace(hour=0, minute=0, second=30, microsecond=0)
-            time.sleep(max(1, (nxt - _dt.now()).total_seconds()))
-            _archive_logs_daily()
+            wait = min(next_rotate - time.monotonic(), (next_archive - _dt.now()).total_seconds(), 3600)
+            if wait > 0 and _bg_stop.wait(wait):
+                return
+            if time.monotonic() >= next_rotate:
+                _rotate_logs()
+                next_rotate = time.monotonic() + _LOG_ROTATE_INTERVAL
+            if _dt.now() >= next_archive:
+                _archive_logs_daily()
+                next_archive = _next_archive_time()
 
-    threading.Thread(target=_daily_archive_loop, daemon=True, name='daily-archiver').start()
+    threading.Thread(target=_log_maintenance_loop, daemon=True, name='log-maintenance').start()
 
     # ─── バックグラウンドで STRUCTURE.md を最新化 ───────────────────────────
+    def _structure_is_stale() -> bool:
+        """直下のファイル/ディレクトリに STRUCTURE.md より新しいものがあるか
+
+        ディレクトリの mtime は直下のエントリ追加・削除で更新されるため、
+        再帰走査せず 1 回の scandir で判定できる（ウォーム再起動の大半はここで打ち切り）。
+        """
+        try:
+            built = STRUCTURE_MD.stat().st_mtime
+        except OSError:
+            return True
+        try:
+            with os.scandir(_HERE) as it:
+                return any(
+                    e.stat(follow_symlinks=False).st_mtime > built
+                    for e in it
+                    if e.name != STRUCTURE_MD.name and not e.name.startswith('.')
+                )
+        except OSError:
+            return True
+
     def _update_structure():
+        if not _structure_is_stale():
+            return
         try:
-            r = subprocess.run(
-                [sys.executable, str(_HERE / 'generate_structure.py')],
-                cwd=str(_HERE), capture_output=True, text=True, timeout=30
-            )
-            if r.returncode == 0:
+            # 別インタプリタを起動せずプロセス内で生成する（署名一致なら書き込みもしない）
+            import generate_structure
+            content = generate_structure.generate()
+            if content is not None:
+                generate_structure.OUTPUT.write_text(content, encoding='utf-8')
                 print('[INFO] STRUCTURE.md を更新しました', flush=True)
-            else:
-                print(f'[WARN] STRUCTURE.md 更新失敗: {r.stderr.strip()}', flush=True)
         except Exception as e:
             print(f'[WARN] STRUCTURE.md 更新エラー: {e}', flush=True)
 
@@ -2221,16 +3955,7 @@ if __name__ == '__main__':
         tunnel URL は trycloudflare.com の一時 URL（Mac 再起動ごとに変わる）。
         """
         global _CF_TUNNEL_URL, _CF_TUNNEL_PROC
-        import shutil as _shutil
-        # launchd は /usr/local/bin を PATH に含まないためフルパスを探す
-        _CF_CANDIDATES = [
-            '/usr/local/bin/cloudflared',
-            '/opt/homebrew/bin/cloudflared',
-            '/usr/bin/cloudflared',
-        ]
-        cloudflared = _shutil.which('cloudflared') or next(
-            (p for p in _CF_CANDIDATES if Path(p).exists()), None
-        )
+        cloudflared = _CF_BINARY
         if not cloudflared:
             print('[INFO] cloudflared が見つかりません。Cloudflare Tunnel はスキップします。', flush=True)
             return
@@ -2245,22 +3970,47 @@ if __name__ == '__main__':
                 [cloudflared, 'tunnel', '--url', f'http://localhost:{PORT}',
                  '--no-autoupdate'],
                 stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
-                text=True, bufsize=1
             )
             _CF_TUNNEL_PROC = proc
 
-            # ログを読んで URL を抽出
-            url_pattern = re.compile(r'https://[a-z0-9\-]+\.trycloudflare\.com')
-            for line in proc.stdout:
-                line = line.rstrip()
-                m = url_pattern.search(line)
-                if m:
-                    _CF_TUNNEL_URL = m.group(0)
-                    print(f'[INFO] Cloudflare Tunnel URL: {_CF_TUNNEL_URL}', flush=True)
-                    break  # URL 取得後はバックグラウンドで動かし続ける
-
-            # stdout を引き続き読み続ける（プロセスを生かすため）
-            for _ in proc.stdout:
+            # ログを読んで URL を抽出 (バイト列のまま照合し、行ごとのデコードはしない)。
+            # 認証失敗・ネットワーク断で URL が出ないまま黙っていることがあるので、select で期限を切る
+            fd = proc.stdout.fileno()
+            buf = b''
+            url = None
+            eof = False
+            deadline = time.monotonic() + _CF_URL_TIMEOUT
+            with selectors.DefaultSelector() as sel:
+                sel.register(fd, selectors.EVENT_READ)
+                while url is None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not sel.select(remaining):
+                        break
+                    chunk = os.read(fd, 65536)
+                    if not chunk:   # cloudflared が終了した
+                        eof = True
+                        break
+                    buf += chunk
+                    m = _CF_URL_RE.search(buf)
+                    if m:
+                        url = m.group(0).decode('ascii')
+                    buf = buf[buf.rfind(b'\n') + 1:]   # 行の途中だけ持ち越す
+            if url is None:
+                try:
+                    # 出力が閉じたなら終了コードを拾う。期限切れならまだ動いているので止める
+                    proc.wait(timeout=5 if eof else 0)
+                    print(f'[WARN] cloudflared が URL を出さずに終了しました (終了コード {proc.returncode})', flush=True)
+                except subprocess.TimeoutExpired:
+                    proc.terminate()
+                    proc.wait(timeout=5)
+                    print(f'[WARN] Cloudflare Tunnel の URL を {_CF_URL_TIMEOUT} 秒以内に取得できなかったため停止しました', flush=True)
+                return
+            _CF_TUNNEL_URL = url
+            print(f'[INFO] Cloudflare Tunnel URL: {_CF_TUNNEL_URL}', flush=True)
+
+            # URL 取得後はバックグラウンドで動かし続け、stdout を読み捨てる
+            # （パイプが詰まってプロセスが止まらないように）。行に分けず、届いた分をまとめて捨てる
+            while os.read(fd, 65536):
                 pass
 
         except Exception as ex:
@@ -2268,9 +4018,16 @@ if __name__ == '__main__':
 
     threading.Thread(target=_start_cloudflare_tunnel, daemon=True, name='cf-tunnel').start()
 
+    # launchd / docker stop / _kill_port は SIGTERM で止めるが、SIGTERM では atexit が走らない。
+    # Ctrl+C と同じ停止処理に流し、予約中の iCloud バックアップ (_flush_icloud_backup) も書かせる
+    def _on_sigterm(signum, frame):
+        raise KeyboardInterrupt
+    _signal.signal(_signal.SIGTERM, _on_sigterm)
+
     try:
         server.serve_forever()
     except KeyboardInterrupt:
+        _bg_stop.set()
         print('\nサーバーを停止しました')
         if _CF_TUNNEL_PROC and _CF_TUNNEL_PROC.poll() is None:
             _CF_TUNNEL_PROC.terminate()
@@ -77,9 +77,12 @@ def detect_status(filename: str) -> str:
     return 'draft'
 
 
+_FILENAME_MONTH_RE = re.compile(r'^(\d{4})(\d{2})分')
+
+
 def detect_month_from_filename(filename: str) -> tuple[str, str] | None:
     """ファイル名から (year, month) を抽出する。例: '202602分_...' → ('2026', '02')"""
-    m = re.match(r'^(\d{4})(\d{2})分', filename)
+    m = _FILENAME_MONTH_RE.match(filename)
     if m:
         return m.group(1), m.group(2)
     return None
@@ -44,9 +44,13 @@ PASSWORD        = os.environ.get('JINJER_PASSWORD', 'philia1904rops')
 # ================================================================
 
 
+_ACTUAL_RE   = re.compile(r'(\d{2}:\d{2})~(\d{2}:\d{2})')
+_DATE_KEY_RE = re.compile(r'(\d{2})月(\d{2})日')
+
+
 def parse_actual(actual_str):
     """'HH:MM~HH:MM' → ('HH:MM', 'HH:MM') or (None, None)"""
-    m = re.match(r'(\d{2}:\d{2})~(\d{2}:\d{2})', actual_str or '')
+    m = _ACTUAL_RE.match(actual_str or '')
     return (m.group(1), m.group(2)) if m else (None, None)
 
 
@@ -72,7 +76,7 @@ def to_pwa_status(row):
 
 def to_date_key(date_text, year, month):
     """'02月02日(月)' + '2026' + '02' → '2026-02-02'"""
-    m = re.match(r'(\d{2})月(\d{2})日', date_text or '')
+    m = _DATE_KEY_RE.match(date_text or '')
     if not m:
         return None
     mm = int(m.group(1))
@@ -235,16 +239,60 @@ async def _goto_month(page, year: str, month: str, screenshot_prefix: str = '')
     return False
 
 
-async def scrape_months(target_months: list) -> dict:
-    """複数月をまとめてスクレイプ（ログイン1回で節約）"""
-    from playwright.async_api import async_playwright
-    all_rows = {}
+# 常駐サーバー用: Playwright / Chromium をプロセス内で 1 つだけ起動して使い回す
+_playwright = None
+_browser = None
+_browser_lock = asyncio.Lock()
+
+
+async def get_browser():
+    """共有 Chromium を返す（未起動・切断時のみ起動）。常に同じイベントループから呼ぶこと。"""
+    global _playwright, _browser
+    async with _browser_lock:
+        if _browser is None or not _browser.is_connected():
+            if _playwright is None:
+                from playwright.async_api import async_playwright
+                _playwright = await async_playwright().start()
+            _browser = await _playwright.chromium.launch(headless=True)
+    return _browser
+
+
+async def close_browser():
+    """get_browser() で起動した Chromium と Playwright を終了する"""
+    global _playwright, _browser
+    if _browser is not None:
+        await _browser.close()
+        _browser = None
+    if _playwright is not None:
+        await _playwright.stop()
+        _playwright = None
+
+
+async def scrape_months(target_months: list, reuse_browser: bool = False) -> dict:
+    """複数月をまとめてスクレイプ（ログイン1回で節約）
 
+    reuse_browser=True なら get_browser() の共有 Chromium 上に新しいコンテキストを作り、
+    終了時はコンテキストだけを閉じる（jinjer_server.py の常駐イベントループ用）。
+    """
+    if reuse_browser:
+        return await _scrape_with_browser(await get_browser(), target_months)
+
+    from playwright.async_api import async_playwright
     async with async_playwright() as p:
         browser = await p.chromium.launch(headless=True)
-        ctx     = await browser.new_context(
-            user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        )
+        try:
+            return await _scrape_with_browser(browser, target_months)
+        finally:
+            await browser.close()
+
+
+async def _scrape_with_browser(browser, target_months: list) -> dict:
+    """browser 上に専用コンテキストを作ってスクレイプする"""
+    all_rows = {}
+    ctx = await browser.new_context(
+        user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+    )
+    try:
         page    = await ctx.new_page()
         page.set_default_timeout(30000)
 
@@ -256,7 +304,6 @@ async def scrape_months(target_months: list) -> dict:
                 print('      📸 ログイン失敗スクリーンショット → logs/jinjer_login_fail.png')
             except Exception:
                 pass
-            await browser.close()
             raise RuntimeError('jinjer へのログインに失敗しました。認証情報を .env で確認してください。')
 
         today_ym = date.today().strftime('%Y-%m')
@@ -312,7 +359,8 @@ async def scrape_months(target_months: list) -> dict:
                 except Exception:
                     pass
 
-        await browser.close()
+    finally:
+        await ctx.close()
 
     return all_rows
 
@@ -344,28 +392,30 @@ _ICLOUD_ROOT = Path.home() / 'Library/Mobile Documents/com~apple~CloudDocs/:root
 ICLOUD_DIR = _ICLOUD_ROOT / 'attendance' / 'jinjer'  # jinjer同期ファイル置き場
 
 
-def save_to_icloud_and_local(target_months: list, pwa_data: dict) -> str:
+def save_to_icloud_and_local(target_months: list, pwa_data: dict, content: bytes | None = None) -> str:
     """
     スクレイプ結果を iCloud Drive とローカルの両方に保存する。
     保存したファイル名を返す。
+    content にエンコード済み JSON バイト列を渡すと、pwa_data を再シリアライズせずそのまま書き込む。
     """
     if len(target_months) == 1:
         filename = f'jinjer_sync_{target_months[0]}.json'
     else:
         filename = f'jinjer_sync_{target_months[0]}_to_{target_months[-1]}.json'
 
-    content = json.dumps(pwa_data, ensure_ascii=False, indent=2)
+    if content is None:
+        content = json.dumps(pwa_data, ensure_ascii=False, indent=2).encode('utf-8')
 
     # ローカルに保存
     local = Path(__file__).parent / filename
-    local.write_text(content, encoding='utf-8')
+    local.write_bytes(content)
     print(f'✅ ローカル保存 → {local}')
 
     # iCloud Driveにもコピー (attendance/jinjer/ フォルダ)
     try:
         ICLOUD_DIR.mkdir(parents=True, exist_ok=True)
         icloud = ICLOUD_DIR / filename
-        icloud.write_text(content, encoding='utf-8')
+        icloud.write_bytes(content)
         print(f'☁️  iCloud Drive → {icloud}')
         print(f'   iPhoneのファイルアプリ → iCloud Drive → :root → attendance → jinjer フォルダ で確認できます')
     except Exception as e: